@@ -1,80 +1,205 @@
+import argparse
+import concurrent.futures
 import os
 import subprocess
 import random
+import tempfile
+import time
 from pathlib import Path
-import difflib
 import logging
 from datetime import datetime
 
+from ocr_eval import Accumulator, ResultWriter, error_rate, score
+
 # logging
-log_filename = f"data/shn_acc_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_filename, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+run_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+log_filename = f"data/shn_acc_test_{run_timestamp}.log"
+results_filename = f"data/shn_acc_test_{run_timestamp}.jsonl"
 
-def test_checkpoint(checkpoint_path, image_path, gt_path):
-    """Test a checkpoint against an image and ground truth file."""
-    cmd = [
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_filename, encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
+# Written by tesseract after the text of every image of a list file.
+PAGE_SEPARATOR = '\f'
+
+def tesseract_command(checkpoint_path, image):
+    return [
         'tesseract',
-        image_path,
+        image,
         'stdout',
         '--tessdata-dir', os.path.dirname(checkpoint_path),
         '-l', os.path.basename(checkpoint_path).replace('.traineddata', ''),
-        '--psm', '6'
+        '--psm', '6',
+        '-c', f'page_separator={PAGE_SEPARATOR}'
     ]
-    
+
+def read_gt(gt_path):
+    with open(gt_path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+def recognize_batch(checkpoint_path, image_paths):
+    """
+    Recognize several images with one tesseract process, so the model is
+    only loaded once, and return the text of each image.
+
+    Raises ValueError if the output can not be split into one text per image.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        list_file = os.path.join(tmpdir, 'images.txt')
+        with open(list_file, 'w', encoding='utf-8') as f:
+            for image_path in image_paths:
+                f.write(os.path.abspath(image_path) + '\n')
+        cmd = tesseract_command(checkpoint_path, list_file)
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+
+    pages = result.stdout.split(PAGE_SEPARATOR)
+    # The separator follows every page, so the last part is empty.
+    if len(pages) == len(image_paths) + 1 and not pages[-1].strip():
+        pages.pop()
+    if len(pages) != len(image_paths):
+        raise ValueError(f"expected {len(image_paths)} pages, got {len(pages)}")
+    return [page.strip() for page in pages]
+
+def test_batch(checkpoint_path, pairs):
+    """
+    Test a checkpoint against a list of image and ground truth file pairs.
+
+    If the batch fails, the images are recognized one by one so a single bad
+    image only affects its own result.
+    """
+    try:
+        texts = recognize_batch(checkpoint_path, [image_path for image_path, _ in pairs])
+    except (subprocess.CalledProcessError, ValueError) as e:
+        logging.warning(f"Batch of {len(pairs)} images failed with {checkpoint_path}, "
+                        f"retrying one by one: {e}")
+        return [test_checkpoint(checkpoint_path, image_path, gt_path)
+                for image_path, gt_path in pairs]
+    return [make_result(checkpoint_path, image_path, read_gt(gt_path), ocr_text)
+            for (image_path, gt_path), ocr_text in zip(pairs, texts)]
+
+def test_checkpoint(checkpoint_path, image_path, gt_path):
+    """Test a checkpoint against an image and ground truth file."""
+    cmd = tesseract_command(checkpoint_path, image_path)
+
+    # Read ground truth
+    gt_text = read_gt(gt_path)
+
     try:
         # Run tesseract with the checkpoint
         result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        ocr_text = result.stdout.strip()
-        
-        # Read ground truth
-        with open(gt_path, 'r', encoding='utf-8') as f:
-            gt_text = f.read().strip()
-        
-        # Calculate similarity
-        similarity = difflib.SequenceMatcher(None, ocr_text, gt_text).ratio() * 100
-        
-        # Log comparison
-        logging.info(f"\nImage: {os.path.basename(image_path)}")
-        logging.info(f"Checkpoint: {os.path.basename(checkpoint_path)}")
-        logging.info(f"Similarity: {similarity:.2f}%")
-        logging.info("-" * 50)
-        # logging.info("Ground Truth:")
-        # logging.info(gt_text)
-        # logging.info("-" * 50)
-        # logging.info("OCR Output:")
-        # logging.info(ocr_text)
-        # logging.info("=" * 50)
-        
-        return {
-            'checkpoint': os.path.basename(checkpoint_path),
-            'image': os.path.basename(image_path),
-            'similarity': similarity,
-            'ocr_text': ocr_text,
-            'gt_text': gt_text
-        }
+        ocr_text = result.stdout.replace(PAGE_SEPARATOR, '').strip()
     except subprocess.CalledProcessError as e:
         logging.error(f"Error testing {checkpoint_path} with {image_path}: {e}")
+        # A failed recognition counts as if nothing was recognized.
         return {
             'checkpoint': os.path.basename(checkpoint_path),
             'image': os.path.basename(image_path),
-            'similarity': 0,
+            **score('', gt_text),
+            'gt_text': gt_text,
             'error': str(e)
         }
 
+    return make_result(checkpoint_path, image_path, gt_text, ocr_text)
+
+def make_result(checkpoint_path, image_path, gt_text, ocr_text):
+    # Calculate character, grapheme cluster and word errors
+    scores = score(ocr_text, gt_text)
+    cer = error_rate(scores['chars_errors'], scores['chars_total'])
+
+    # Log comparison
+    logging.debug(f"Image: {os.path.basename(image_path)}")
+    logging.debug(f"Checkpoint: {os.path.basename(checkpoint_path)}")
+    logging.debug(f"CER: {cer:.2f}%")
+
+    return {
+        'checkpoint': os.path.basename(checkpoint_path),
+        'image': os.path.basename(image_path),
+        **scores,
+        'ocr_text': ocr_text,
+        'gt_text': gt_text
+    }
+
+def format_stats(stats):
+    return f"CER: {stats.cer:.2f}%  Cluster ER: {stats.cluster_er:.2f}%  WER: {stats.wer:.2f}%"
+
+def run_round(executor, checkpoints, pairs, checkpoint_stats, writer, jobs, batch_size):
+    """
+    Score all checkpoints on all pairs in the process pool.
+
+    Each task recognizes a batch of pairs with one checkpoint. The batches are
+    made smaller if needed to keep all workers busy. The results are streamed
+    to the writer and added to checkpoint_stats as they come in.
+    """
+    total = len(checkpoints) * len(pairs)
+    batch_size = max(1, min(batch_size, -(-total // jobs)))
+    pairs = [(str(image_path), str(gt_path)) for image_path, gt_path in pairs]
+    futures = [
+        executor.submit(test_batch, str(checkpoint), pairs[i:i + batch_size])
+        for checkpoint in checkpoints
+        for i in range(0, len(pairs), batch_size)
+    ]
+    done = 0
+    start = time.monotonic()
+    last_report = start
+    for future in concurrent.futures.as_completed(futures):
+        for result in future.result():
+            writer.write(result)
+            checkpoint_stats[result['checkpoint']].add(result)
+            done += 1
+        now = time.monotonic()
+        if now - last_report >= 10 or done == total:
+            last_report = now
+            rate = done / max(now - start, 1e-9)
+            logging.info(f"  {done}/{total} recognitions done ({rate:.1f}/s)")
+
+def eliminate(checkpoint_stats, candidates, margin):
+    """
+    Return the candidates whose CER is within margin percentage points of the
+    current leader, and the ones which are dropped.
+    """
+    best_cer = min(checkpoint_stats[c.name].cer for c in candidates)
+    survivors = [c for c in candidates if checkpoint_stats[c.name].cer <= best_cer + margin]
+    dropped = [c for c in candidates if checkpoint_stats[c.name].cer > best_cer + margin]
+    return survivors, dropped
+
 def main():
+    arg_parser = argparse.ArgumentParser(
+        description='Rank checkpoints by their error rates on a random ground truth sample')
+    arg_parser.add_argument('--checkpoints-dir', default='data/shn/tessdata_best',
+                            help='Directory with the *.traineddata checkpoints (default: %(default)s)')
+    arg_parser.add_argument('--ground-truth-dir', default='data/shn-ground-truth',
+                            help='Directory with *.tif and *.gt.txt pairs (default: %(default)s)')
+    arg_parser.add_argument('-n', '--sample-size', type=int, default=300,
+                            help='Number of randomly selected pairs (default: %(default)s)')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=0,
+                            help='Number of parallel tesseract processes (default: all CPUs)')
+    arg_parser.add_argument('-b', '--batch-size', type=int, default=50,
+                            help='Number of images recognized by one tesseract process (default: %(default)s)')
+    arg_parser.add_argument('--initial-sample', type=int, default=50,
+                            help='Number of pairs scored by all checkpoints before early '
+                                 'elimination (default: %(default)s, 0 disables elimination)')
+    arg_parser.add_argument('--margin', type=float, default=5.0,
+                            help='Drop checkpoints whose CER on the initial sample is more than '
+                                 'this many percentage points worse than the leader (default: %(default)s)')
+    args = arg_parser.parse_args()
+
+    setup_logging()
+
     # Paths
-    checkpoints_dir = Path('data/shn/tessdata_best')
-    test_images_dir = Path('data/shn-ground-truth')
+    checkpoints_dir = Path(args.checkpoints_dir)
+    test_images_dir = Path(args.ground_truth_dir)
+
+    test_sample_length = args.sample_size
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
 
-    test_sample_length = 300
-    
     # Find all checkpoint files
     checkpoints = list(checkpoints_dir.glob('*.traineddata'))
     if not checkpoints:
@@ -97,62 +222,64 @@ def main():
     random.shuffle(valid_test_pairs)
     test_sample = valid_test_pairs[:min(test_sample_length, len(valid_test_pairs))]
     
-    logging.info(f"Testing with {len(test_sample)} randomly selected image-ground truth pairs")
-    
-    # Store results for all checkpoints
-    all_results = []
-    
-    # Test each checkpoint with the same set of images
-    for checkpoint in checkpoints:
-        logging.info(f"\nTesting checkpoint: {checkpoint.name}")
-        checkpoint_results = []
-        
-        for image_path, gt_path in test_sample:
-            result = test_checkpoint(str(checkpoint), str(image_path), str(gt_path))
-            checkpoint_results.append(result)
-            all_results.append(result)
-        
-        # Calculate average similarity for this checkpoint
-        if checkpoint_results:
-            avg_similarity = sum(r['similarity'] for r in checkpoint_results) / len(checkpoint_results)
-            logging.info(f"  Average Similarity: {avg_similarity:.2f}%")
-            logging.info("-" * 50)
-    
-    # Sort checkpoints by average similarity
-    checkpoint_avg = {}
-    for result in all_results:
-        checkpoint = result['checkpoint']
-        if checkpoint not in checkpoint_avg:
-            checkpoint_avg[checkpoint] = {'similarity_sum': 0, 'count': 0}
-        
-        checkpoint_avg[checkpoint]['similarity_sum'] += result['similarity']
-        checkpoint_avg[checkpoint]['count'] += 1
-    
-    # Calculate averages and sort
-    for checkpoint in checkpoint_avg:
-        count = checkpoint_avg[checkpoint]['count']
-        checkpoint_avg[checkpoint]['avg_similarity'] = checkpoint_avg[checkpoint]['similarity_sum'] / count
-    
-    # Sort by average similarity
-    sorted_checkpoints = sorted(
-        checkpoint_avg.items(),
-        key=lambda x: x[1]['avg_similarity'],
-        reverse=True
-    )
-    
+    logging.info(f"Testing {len(checkpoints)} checkpoints with {len(test_sample)} randomly selected image-ground truth pairs")
+    logging.info(f"Running {jobs} tesseract processes in parallel")
+    logging.info(f"Writing per-sample results to {results_filename}")
+
+    # Every tesseract process gets one core, parallelism comes from the pool.
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+    # Only running totals are kept in memory, the per-sample results
+    # (including the texts) are streamed to the results file.
+    checkpoint_stats = {checkpoint.name: Accumulator() for checkpoint in checkpoints}
+    dropped = []
+
+    initial = args.initial_sample
+    if initial <= 0 or initial >= len(test_sample) or len(checkpoints) < 2:
+        rounds = [test_sample]
+    else:
+        rounds = [test_sample[:initial], test_sample[initial:]]
+
+    # Test the checkpoints with the same set of images
+    candidates = checkpoints
+    with ResultWriter(results_filename) as writer, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        for round_number, pairs in enumerate(rounds):
+            if round_number > 0:
+                candidates, eliminated = eliminate(checkpoint_stats, candidates, args.margin)
+                for checkpoint in eliminated:
+                    logging.info(f"Dropping {checkpoint.name} after {initial} samples: "
+                                 f"{format_stats(checkpoint_stats[checkpoint.name])}")
+                dropped.extend(eliminated)
+            logging.info(f"\nScoring {len(candidates)} checkpoints on {len(pairs)} samples")
+            run_round(executor, candidates, pairs, checkpoint_stats, writer, jobs, args.batch_size)
+
+    # Sort checkpoints by character error rate
+    def rank(checkpoints):
+        return sorted(
+            ((c.name, checkpoint_stats[c.name]) for c in checkpoints),
+            key=lambda x: (x[1].cer, x[1].cluster_er, x[1].wer)
+        )
+    sorted_checkpoints = rank(candidates)
+
     # Print final sorted results
     logging.info("\nCheckpoints Ranked by Performance:")
     logging.info("=" * 70)
     for i, (checkpoint, stats) in enumerate(sorted_checkpoints, 1):
         logging.info(f"{i}. {checkpoint}")
-        logging.info(f"   Average Similarity: {stats['avg_similarity']:.2f}%")
-    
+        logging.info(f"   {format_stats(stats)}")
+    if dropped:
+        logging.info(f"\nDropped after {initial} samples:")
+        for checkpoint, stats in rank(dropped):
+            logging.info(f"-  {checkpoint}")
+            logging.info(f"   {format_stats(stats)}")
+
     # Print the best checkpoint
     if sorted_checkpoints:
-        best_checkpoint = sorted_checkpoints[0][0]
+        best_checkpoint, best_stats = sorted_checkpoints[0]
         logging.info("\n" + "=" * 70)
         logging.info(f"Best Checkpoint: {best_checkpoint}")
-        logging.info(f"Average Similarity: {sorted_checkpoints[0][1]['avg_similarity']:.2f}%")
+        logging.info(format_stats(best_stats))
         logging.info(f"Tested with {len(test_sample)} random samples")
 
 if __name__ == "__main__":
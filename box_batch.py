@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+"""
+Batch mode shared by the generate_*_box.py scripts.
+
+The %.box rules in the Makefile start a new Python interpreter for every
+line image. In batch mode the box files for a whole ground truth directory
+(or a manifest of image/text pairs) are written by a pool of long-lived
+worker processes instead. Box files which are newer than both their image
+and their ground truth text are skipped, so reruns are incremental.
+"""
+
+import concurrent.futures
+import os
+import sys
+
+import image_size
+
+# Same order as the %.box rules in the Makefile.
+IMAGE_EXTENSIONS = ('.png', '.bin.png', '.nrm.png', '.raw.png', '.tif')
+
+_write_box = None
+
+
+def add_arguments(arg_parser):
+    """Add the batch mode options to the argument parser of a box script."""
+    group = arg_parser.add_mutually_exclusive_group()
+    group.add_argument(
+        '-d',
+        '--dir',
+        metavar='DIR',
+        help='Ground truth directory: create box files for all *.gt.txt files',
+    )
+    group.add_argument(
+        '-m',
+        '--manifest',
+        metavar='MANIFEST',
+        help='File with one tab separated IMAGE and TXT pair per line',
+    )
+    arg_parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=0,
+        help='Number of worker processes in batch mode (default: all CPUs)',
+    )
+    arg_parser.add_argument(
+        '--size-cache',
+        metavar='FILE',
+        help='Persistent cache file for the image sizes',
+    )
+    arg_parser.add_argument(
+        '-f',
+        '--force',
+        action='store_true',
+        help='Rewrite box files even if they are up to date',
+    )
+
+
+def is_batch(args):
+    return bool(args.dir or args.manifest)
+
+
+def find_image(stem):
+    for ext in IMAGE_EXTENSIONS:
+        image = stem + ext
+        if os.path.exists(image):
+            return image
+    return None
+
+
+def find_pairs(directory):
+    """Yield (image, txt, box) for all ground truth files below directory."""
+    for root, dirs, files in os.walk(directory, followlinks=True):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith('.gt.txt'):
+                continue
+            txt = os.path.join(root, name)
+            stem = txt[: -len('.gt.txt')]
+            image = find_image(stem)
+            if image is None:
+                print('WARNING: %s: no line image found' % txt, file=sys.stderr)
+                continue
+            yield image, txt, stem + '.box'
+
+
+def read_manifest(manifest):
+    """Yield (image, txt, box) for all lines of a manifest file."""
+    with open(manifest, 'r', encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            fields = line.split('\t')
+            if len(fields) not in (2, 3):
+                raise ValueError(
+                    'ERROR: %s:%d: expected IMAGE<TAB>TXT[<TAB>BOX]'
+                    % (manifest, lineno)
+                )
+            image, txt = fields[:2]
+            if len(fields) == 3:
+                box = fields[2]
+            elif txt.endswith('.gt.txt'):
+                box = txt[: -len('.gt.txt')] + '.box'
+            else:
+                box = os.path.splitext(txt)[0] + '.box'
+            yield image, txt, box
+
+
+def is_up_to_date(image, txt, box):
+    try:
+        box_mtime = os.stat(box).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    return box_mtime >= max(
+        os.stat(image).st_mtime_ns, os.stat(txt).st_mtime_ns
+    )
+
+
+def _init_worker(write_box, size_cache):
+    global _write_box
+    _write_box = write_box
+    image_size.open_cache(size_cache)
+
+
+def _write_one(pair):
+    image, txt, box = pair
+    tmp = box + '.tmp'
+    try:
+        # Write to a temporary file first: an interrupted run must not leave
+        # a partial box file which looks up to date on the next run.
+        with open(tmp, 'w', encoding='utf-8', newline='\n') as out:
+            _write_box(image, txt, out)
+        os.replace(tmp, box)
+    except Exception as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return box, str(e), image_size.take_pending()
+    # New image sizes are returned to the main process, which is the only
+    # one writing to the size cache.
+    return box, None, image_size.take_pending()
+
+
+def run(write_box, args):
+    """
+    Create the box files for all pairs selected by args in a process pool.
+
+    write_box(image, txt, out) must be a module level function which writes
+    the box file for one pair to the file object out.
+
+    Returns the exit status for the script.
+    """
+    if args.dir:
+        pairs = find_pairs(args.dir)
+    else:
+        pairs = read_manifest(args.manifest)
+
+    todo = []
+    skipped = 0
+    for image, txt, box in pairs:
+        if not args.force and is_up_to_date(image, txt, box):
+            skipped += 1
+        else:
+            todo.append((image, txt, box))
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+    jobs = min(jobs, len(todo)) or 1
+    if jobs == 1:
+        _init_worker(write_box, args.size_cache)
+        results = map(_write_one, todo)
+        executor = None
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(write_box, args.size_cache),
+        )
+        chunksize = max(1, min(256, len(todo) // (jobs * 4)))
+        results = executor.map(_write_one, todo, chunksize=chunksize)
+
+    failed = 0
+    sizes = {}
+    try:
+        for box, error, new_sizes in results:
+            sizes.update(new_sizes)
+            if error:
+                failed += 1
+                print('ERROR: %s: %s' % (box, error), file=sys.stderr)
+    finally:
+        if executor:
+            executor.shutdown()
+        if args.size_cache:
+            cache = image_size.SizeCache(args.size_cache)
+            cache.store(sizes)
+            cache.close()
+
+    print(
+        '%d box files written, %d up to date, %d failed'
+        % (len(todo) - failed, skipped, failed),
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
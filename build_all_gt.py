@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+"""
+Build the all-gt file (the input of unicharset_extractor) and its character
+histogram in a single pass.
+
+All .gt.txt files below the given directories (and the lines of packed
+shards, see line_shards.py) are read by a pool of threads in bounded
+windows and streamed to the output file in sorted order, while the
+grapheme clusters are counted (see count_chars.py) for the charfreq target.
+
+A manifest next to the output records the size, modification time and
+digest of every input. If no digest changed since the last build, all-gt is
+left untouched (so targets depending on it are not rebuilt), and only the
+files whose size or modification time changed are read to find out.
+
+    build_all_gt.py --output data/foo/all-gt data/foo-ground-truth
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+import sys
+
+from count_chars import CharCounts, write_clusters
+
+# Number of files read concurrently and held in memory at once.
+WINDOW = 1024
+
+
+def find_gt_files(directory):
+    """Yield the .gt.txt files below directory."""
+    for root, dirs, files in os.walk(directory, followlinks=True):
+        for name in files:
+            if name.endswith('.gt.txt'):
+                yield os.path.join(root, name)
+
+
+def find_shards(directory):
+    return [
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith('.tar')
+    ]
+
+
+def gt_line(text):
+    # Same as $(file <F) in make: the final newline is removed, then one is appended.
+    if text.endswith('\n'):
+        text = text[:-1]
+    return text + '\n'
+
+
+def read_input(path):
+    """Return the text of a ground truth file, or all texts of a shard, as all-gt lines."""
+    if path.endswith('.tar'):
+        import line_shards
+
+        with line_shards.ShardReader(path) as reader:
+            return ''.join(gt_line(sample.text) for sample in reader)
+    with open(path, 'r', encoding='utf-8') as f:
+        return gt_line(f.read())
+
+
+def text_digest(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def read_manifest(filename):
+    if not filename or not os.path.exists(filename):
+        return {}
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def windows(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        window = list(itertools.islice(iterator, size))
+        if not window:
+            return
+        yield window
+
+
+def check_inputs(paths, previous, executor):
+    """
+    Return {path: [size, mtime, digest]} for all inputs, reusing the digests
+    of the previous manifest for files with unchanged size and mtime.
+    """
+    def entry(path):
+        key = stat_key(path)
+        old = previous.get(path)
+        if old and old[:2] == key:
+            return key + old[2:]
+        return key + [text_digest(read_input(path))]
+
+    entries = {}
+    for window in windows(paths, WINDOW):
+        entries.update(zip(window, executor.map(entry, window)))
+    return entries
+
+
+def build(paths, output, executor):
+    """
+    Write the inputs to output and return ({path: [size, mtime, digest]},
+    CharCounts).
+    """
+    counts = CharCounts()
+    entries = {}
+    tmp = output + '.tmp'
+
+    def read(path):
+        key = stat_key(path)
+        return key, read_input(path)
+
+    with open(tmp, 'w', encoding='utf-8', newline='\n') as out:
+        for window in windows(paths, WINDOW):
+            for path, (key, text) in zip(window, executor.map(read, window)):
+                out.write(text)
+                counts.add_text(text)
+                entries[path] = key + [text_digest(text)]
+    os.replace(tmp, output)
+    return entries, counts
+
+
+def write_charfreq(counts, filename):
+    with open(filename, 'w', encoding='utf-8', newline='\n') as f:
+        write_clusters(counts, f)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='Concatenate ground truth texts into all-gt and count their characters'
+    )
+    arg_parser.add_argument(
+        'dirs', nargs='*', help='Directories with .gt.txt files (searched recursively)'
+    )
+    arg_parser.add_argument(
+        '--shards', action='append', default=[], metavar='DIR',
+        help='Directory with packed line shards (.tar) to read',
+    )
+    arg_parser.add_argument('--output', required=True, help='all-gt file to write')
+    arg_parser.add_argument(
+        '--manifest', help='Manifest of the inputs (default: OUTPUT.manifest)'
+    )
+    arg_parser.add_argument(
+        '--charfreq', help='Character histogram (default: OUTPUT.charfreq)'
+    )
+    arg_parser.add_argument(
+        '-j', '--jobs', type=int, default=8, help='Number of reader threads (default: %(default)s)'
+    )
+    args = arg_parser.parse_args()
+
+    manifest = args.manifest or args.output + '.manifest'
+    charfreq = args.charfreq or args.output + '.charfreq'
+
+    paths = []
+    for directory in args.dirs:
+        paths.extend(find_gt_files(directory))
+    for directory in args.shards:
+        paths.extend(find_shards(directory))
+    paths.sort()
+    if not paths:
+        print('ERROR: found no ground truth in %s' % ' '.join(args.dirs + args.shards), file=sys.stderr)
+        sys.exit(1)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        previous = read_manifest(manifest)
+        if previous and os.path.exists(args.output) and os.path.exists(charfreq):
+            entries = check_inputs(paths, previous, executor)
+            digests = {path: entry[2] for path, entry in entries.items()}
+            if digests == {path: entry[2] for path, entry in previous.items()}:
+                if entries != previous:
+                    # Only touched: keep all-gt, but remember the new mtimes.
+                    with open(manifest, 'w', encoding='utf-8') as f:
+                        json.dump(entries, f)
+                print('%s is up to date (%d files)' % (args.output, len(paths)), file=sys.stderr)
+                return
+        entries, counts = build(paths, args.output, executor)
+
+    write_charfreq(counts, charfreq)
+    with open(manifest, 'w', encoding='utf-8') as f:
+        json.dump(entries, f)
+    print('%s: %d files, %d clusters' % (args.output, len(paths), sum(counts.clusters.values())), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,46 +15,214 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import getopt
+"""
+Streaming character statistics for ground truth texts and corpora.
+
+Counts code points, grapheme clusters (split like generate_line_syllable_box.py)
+and cluster bigrams of text files, directories of .gt.txt files and packed
+line shards. Large text files are split into byte ranges and small files
+into batches which are counted in parallel and merged.
+
+    count_chars.py corpus.txt > corpus.charcount
+    count_chars.py --output data/foo/charcount data/foo-ground-truth
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
 import sys
 import unicodedata
 
+from generate_line_syllable_box import splitclusters
+
+# Bytes of a text file per task.
+CHUNK_SIZE = 4 << 20
+# Ground truth files per task.
+FILES_PER_TASK = 512
+
+
+class CharCounts:
+    """Code point, cluster and cluster bigram counts of a number of lines."""
+
+    def __init__(self):
+        self.lines = 0
+        self.codepoints = collections.Counter()
+        self.clusters = collections.Counter()
+        self.bigrams = collections.Counter()
+
+    def add_line(self, line):
+        line = line.rstrip('\r\n')
+        self.lines += 1
+        self.codepoints.update(line)
+        clusters = list(splitclusters(line))
+        self.clusters.update(clusters)
+        self.bigrams.update(zip(clusters, clusters[1:]))
+
+    def add_text(self, text):
+        for line in text.splitlines():
+            self.add_line(line)
 
-def main(argv):
-    txt_file = ''
-    try:
-        opts, args = getopt.getopt(argv, 'h')
-    except getopt.GetoptError:
-        print('USAGE: count_chars.py <txt_file>')
-        sys.exit(2)
-    for opt, arg in opts:
-        if opt in ('-h', '--help'):
-            print(
-                'USAGE: count_chars.py <txt_file> | sort -n -r > <txt_file>.charcount'
-            )
-            sys.exit()
-    for arg in args:
-        txt_file = arg
-
-    inFile = open(txt_file)
-    rawText = inFile.read()
-    inFile.close()
-
-    chars = {}
-    for char in rawText:
-        if char not in chars:
-            chars[char] = 1
+    def update(self, other):
+        self.lines += other.lines
+        self.codepoints.update(other.codepoints)
+        self.clusters.update(other.clusters)
+        self.bigrams.update(other.bigrams)
+
+
+def find_gt_files(directory):
+    for root, dirs, files in os.walk(directory, followlinks=True):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith('.gt.txt'):
+                yield os.path.join(root, name)
+
+
+def plan_tasks(paths, chunk_size=CHUNK_SIZE):
+    """Yield the tasks for count_task() for files, directories and shards."""
+    for path in paths:
+        if os.path.isdir(path):
+            batch = []
+            for filename in find_gt_files(path):
+                batch.append(filename)
+                if len(batch) >= FILES_PER_TASK:
+                    yield ('files', batch)
+                    batch = []
+            if batch:
+                yield ('files', batch)
+        elif path.endswith('.tar'):
+            yield ('shard', path)
         else:
-            chars[char] += 1
+            size = os.path.getsize(path)
+            for start in range(0, max(size, 1), chunk_size):
+                yield ('range', path, start, min(start + chunk_size, size))
+
+
+def count_range(path, start, end):
+    """Count the lines of a file which start in the byte range [start, end)."""
+    counts = CharCounts()
+    with open(path, 'rb') as f:
+        if start:
+            # Skip the line which started in the previous range.
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            counts.add_line(line.decode('utf-8', errors='replace'))
+    return counts
+
+
+def count_task(task):
+    kind = task[0]
+    if kind == 'range':
+        return count_range(*task[1:])
+    counts = CharCounts()
+    if kind == 'files':
+        for filename in task[1]:
+            with open(filename, 'r', encoding='utf-8', errors='replace') as f:
+                counts.add_text(f.read())
+    else:
+        import line_shards
+
+        with line_shards.ShardReader(task[1]) as reader:
+            for sample in reader:
+                counts.add_text(sample.text)
+    return counts
+
+
+def count_paths(paths, jobs=None):
+    """Count all inputs in a pool of worker processes and return the merged CharCounts."""
+    total = CharCounts()
+    with multiprocessing.Pool(jobs) as pool:
+        for counts in pool.imap_unordered(count_task, plan_tasks(paths)):
+            total.update(counts)
+    return total
+
+
+def display(text):
+    """Escape control characters (e.g. tabs), so every entry stays on one TSV line."""
+    return ''.join(
+        '\\u%04x' % ord(c) if unicodedata.category(c).startswith('C') else c for c in text
+    )
+
+
+def most_common(counter):
+    return sorted(counter.items(), key=lambda item: (-item[1], item[0]))
+
+
+def write_codepoints(counts, f):
+    for char, count in most_common(counts.codepoints):
+        print('%d\t%s\tU+%04X\t%s' % (count, display(char), ord(char), unicodedata.name(char, '')), file=f)
+
+
+def write_clusters(counts, f):
+    for cluster, count in most_common(counts.clusters):
+        codes = ' '.join('U+%04X' % ord(c) for c in cluster)
+        print('%d\t%s\t%s' % (count, display(cluster), codes), file=f)
+
+
+def write_bigrams(counts, f):
+    for (first, second), count in most_common(counts.bigrams):
+        print('%d\t%s\t%s' % (count, display(first), display(second)), file=f)
+
+
+def write_json(counts, f):
+    json.dump(
+        {
+            'lines': counts.lines,
+            'codepoints': dict(most_common(counts.codepoints)),
+            'clusters': dict(most_common(counts.clusters)),
+            'bigrams': [[first, second, count] for (first, second), count in most_common(counts.bigrams)],
+        },
+        f,
+        ensure_ascii=False,
+    )
+
+
+def write_outputs(counts, prefix):
+    """Write PREFIX.codepoints.tsv, PREFIX.clusters.tsv, PREFIX.bigrams.tsv and PREFIX.json."""
+    for suffix, write in (
+        ('.codepoints.tsv', write_codepoints),
+        ('.clusters.tsv', write_clusters),
+        ('.bigrams.tsv', write_bigrams),
+        ('.json', write_json),
+    ):
+        with open(prefix + suffix, 'w', encoding='utf-8', newline='\n') as f:
+            write(counts, f)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='Count code points, grapheme clusters and cluster bigrams'
+    )
+    arg_parser.add_argument(
+        'inputs', nargs='+',
+        help='Text files, directories with .gt.txt files or line shards (.tar)',
+    )
+    arg_parser.add_argument(
+        '--output', metavar='PREFIX',
+        help='Write PREFIX.{codepoints,clusters,bigrams}.tsv and PREFIX.json '
+        '(default: code point counts to stdout)',
+    )
+    arg_parser.add_argument(
+        '--clusters', action='store_true', help='Print the cluster counts instead of the code points'
+    )
+    arg_parser.add_argument(
+        '-j', '--jobs', type=int, default=None, help='Number of worker processes (default: all CPUs)'
+    )
+    args = arg_parser.parse_args()
 
-    keys = list(chars.keys())
-    keys.sort()
-    for char in keys:
-        try:
-            print(chars[char], '\t', char, '\t', unicodedata.name(char))
-        except:
-            pass
+    counts = count_paths(args.inputs, args.jobs)
+    if args.output:
+        write_outputs(counts, args.output)
+    elif args.clusters:
+        write_clusters(counts, sys.stdout)
+    else:
+        write_codepoints(counts, sys.stdout)
 
 
 if __name__ == '__main__':
-    main(sys.argv[1:])
+    main()
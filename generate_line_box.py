@@ -2,64 +2,94 @@
 
 import argparse
 import io
+import sys
 import unicodedata
 
-from PIL import Image
-
-#
-# command line arguments
-#
-arg_parser = argparse.ArgumentParser(
-    """Creates tesseract box files for given (line) image text pairs"""
-)
-
-# Text ground truth
-arg_parser.add_argument(
-    '-t',
-    '--txt',
-    nargs='?',
-    metavar='TXT',
-    help='Line text (GT)',
-    required=True,
-)
-
-# Image file
-arg_parser.add_argument(
-    '-i',
-    '--image',
-    nargs='?',
-    metavar='IMAGE',
-    help='Image file',
-    required=True,
-)
-
-args = arg_parser.parse_args()
-
-#
-# main
-#
-
-# Get image size.
-width, height = Image.open(args.image).size
-
-# load gt
-with io.open(args.txt, 'r', encoding='utf-8') as f:
-    lines = f.read().strip().split('\n')
-    if len(lines) != 1:
-        raise ValueError(
-            'ERROR: %s: Ground truth text file should contain exactly one line, not %s'
-            % (args.txt, len(lines))
-        )
-    line = unicodedata.normalize('NFC', lines[0].strip())
-
-if line:
-    for i in range(1, len(line)):
-        char = line[i]
-        prev_char = line[i - 1]
-        if unicodedata.combining(char):
-            print('%s 0 0 %d %d 0' % ((prev_char + char), width, height))
-        elif not unicodedata.combining(prev_char):
-            print('%s 0 0 %d %d 0' % (prev_char, width, height))
-    if not unicodedata.combining(line[-1]):
-        print('%s 0 0 %d %d 0' % (line[-1], width, height))
-    print('\t 0 0 %d %d 0' % (width, height))
+import box_batch
+import image_size
+
+
+def read_gt(txt):
+    """Read the single (NFC normalized) line of a ground truth text file."""
+    with io.open(txt, 'r', encoding='utf-8') as f:
+        lines = f.read().strip().split('\n')
+        if len(lines) != 1:
+            raise ValueError(
+                'ERROR: %s: Ground truth text file should contain exactly one line, not %s'
+                % (txt, len(lines))
+            )
+        return unicodedata.normalize('NFC', lines[0].strip())
+
+
+def box_lines(line, width, height, page=0):
+    """Generate the box file lines for a text line spanning the whole image."""
+    if line:
+        for i in range(1, len(line)):
+            char = line[i]
+            prev_char = line[i - 1]
+            if unicodedata.combining(char):
+                yield '%s 0 0 %d %d %d' % ((prev_char + char), width, height, page)
+            elif not unicodedata.combining(prev_char):
+                yield '%s 0 0 %d %d %d' % (prev_char, width, height, page)
+        if not unicodedata.combining(line[-1]):
+            yield '%s 0 0 %d %d %d' % (line[-1], width, height, page)
+        yield '\t 0 0 %d %d %d' % (width, height, page)
+
+
+def write_box(image, txt, out):
+    # Get image size.
+    width, height = image_size.get_size(image)
+
+    # load gt
+    line = read_gt(txt)
+
+    for box in box_lines(line, width, height):
+        print(box, file=out)
+
+
+def main():
+    #
+    # command line arguments
+    #
+    arg_parser = argparse.ArgumentParser(
+        """Creates tesseract box files for given (line) image text pairs"""
+    )
+
+    # Text ground truth
+    arg_parser.add_argument(
+        '-t',
+        '--txt',
+        nargs='?',
+        metavar='TXT',
+        help='Line text (GT)',
+    )
+
+    # Image file
+    arg_parser.add_argument(
+        '-i',
+        '--image',
+        nargs='?',
+        metavar='IMAGE',
+        help='Image file',
+    )
+
+    # Batch mode
+    box_batch.add_arguments(arg_parser)
+
+    args = arg_parser.parse_args()
+
+    #
+    # main
+    #
+
+    if box_batch.is_batch(args):
+        sys.exit(box_batch.run(write_box, args))
+    if not args.txt or not args.image:
+        arg_parser.error('the following arguments are required: -t/--txt, -i/--image')
+    image_size.open_cache(args.size_cache)
+    write_box(args.image, args.txt, sys.stdout)
+    image_size.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,42 +2,11 @@
 
 import argparse
 import io
+import sys
 import unicodedata
 
-from PIL import Image
-
-#
-# command line arguments
-#
-arg_parser = argparse.ArgumentParser(
-    """Creates tesseract box files for given (line) image text pairs"""
-)
-
-# Text ground truth
-arg_parser.add_argument(
-    '-t',
-    '--txt',
-    nargs='?',
-    metavar='TXT',
-    help='Line text (GT)',
-    required=True,
-)
-
-# Image file
-arg_parser.add_argument(
-    '-i',
-    '--image',
-    nargs='?',
-    metavar='IMAGE',
-    help='Image file',
-    required=True,
-)
-
-args = arg_parser.parse_args()
-
-#
-# main
-#
+import box_batch
+import image_size
 
 # https://stackoverflow.com/questions/6805311/combining-devanagari-characters
 # Letters are category Lo (Letter, Other), vowel signs are category Mc (Mark, Spacing Combining),
@@ -71,20 +40,80 @@ def splitclusters(s):
         yield cluster
 
 
-# Get image size.
-width, height = Image.open(args.image).size
-
-# load gt
-with io.open(args.txt, 'r', encoding='utf-8') as f:
-    lines = f.read().strip().split('\n')
-    if len(lines) != 1:
-        raise ValueError(
-            'ERROR: %s: Ground truth text file should contain exactly one line, not %s'
-            % (args.txt, len(lines))
-        )
-    line = unicodedata.normalize('NFC', lines[0].strip())
-
-if line:
-    for syllable in splitclusters(line):
-        print('%s 0 0 %d %d 0' % (syllable, width, height))
-        print('\t 0 0 %d %d 0' % (width, height))
+def read_gt(txt):
+    """Read the single (NFC normalized) line of a ground truth text file."""
+    with io.open(txt, 'r', encoding='utf-8') as f:
+        lines = f.read().strip().split('\n')
+        if len(lines) != 1:
+            raise ValueError(
+                'ERROR: %s: Ground truth text file should contain exactly one line, not %s'
+                % (txt, len(lines))
+            )
+        return unicodedata.normalize('NFC', lines[0].strip())
+
+
+def box_lines(line, width, height, page=0):
+    """Generate the box file lines with one box per syllable."""
+    if line:
+        for syllable in splitclusters(line):
+            yield '%s 0 0 %d %d %d' % (syllable, width, height, page)
+            yield '\t 0 0 %d %d %d' % (width, height, page)
+
+
+def write_box(image, txt, out):
+    # Get image size.
+    width, height = image_size.get_size(image)
+
+    # load gt
+    line = read_gt(txt)
+
+    for box in box_lines(line, width, height):
+        print(box, file=out)
+
+
+def main():
+    #
+    # command line arguments
+    #
+    arg_parser = argparse.ArgumentParser(
+        """Creates tesseract box files for given (line) image text pairs"""
+    )
+
+    # Text ground truth
+    arg_parser.add_argument(
+        '-t',
+        '--txt',
+        nargs='?',
+        metavar='TXT',
+        help='Line text (GT)',
+    )
+
+    # Image file
+    arg_parser.add_argument(
+        '-i',
+        '--image',
+        nargs='?',
+        metavar='IMAGE',
+        help='Image file',
+    )
+
+    # Batch mode
+    box_batch.add_arguments(arg_parser)
+
+    args = arg_parser.parse_args()
+
+    #
+    # main
+    #
+
+    if box_batch.is_batch(args):
+        sys.exit(box_batch.run(write_box, args))
+    if not args.txt or not args.image:
+        arg_parser.error('the following arguments are required: -t/--txt, -i/--image')
+    image_size.open_cache(args.size_cache)
+    write_box(args.image, args.txt, sys.stdout)
+    image_size.flush()
+
+
+if __name__ == '__main__':
+    main()
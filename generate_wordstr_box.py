@@ -2,61 +2,88 @@
 
 import argparse
 import io
+import sys
 import unicodedata
 
 import bidi.algorithm
-from PIL import Image
-
-#
-# command line arguments
-#
-arg_parser = argparse.ArgumentParser(
-    """Creates tesseract WordStr box files for given (line) image text pairs"""
-)
-
-# Text ground truth
-arg_parser.add_argument(
-    '-t',
-    '--txt',
-    nargs='?',
-    metavar='TXT',
-    help='Line text (GT)',
-    required=True,
-)
-
-# Image file
-arg_parser.add_argument(
-    '-i',
-    '--image',
-    nargs='?',
-    metavar='IMAGE',
-    help='Image file',
-    required=True,
-)
-
-args = arg_parser.parse_args()
-
-#
-# main
-#
-
-# load image
-with open(args.image, 'rb') as f:
-    im = Image.open(f)
-    width, height = im.size
-
-# load gt
-with io.open(args.txt, 'r', encoding='utf-8') as f:
-    lines = f.read().strip().split('\n')
-    if len(lines) != 1:
-        raise ValueError(
-            'ERROR: %s: Ground truth text file should contain exactly one line, not %s'
-            % (args.txt, len(lines))
-        )
-    line = unicodedata.normalize('NFC', lines[0].strip())
-
-# create WordStr line boxes for Indic & RTL
-if line:
-    line = bidi.algorithm.get_display(line)
-    print('WordStr 0 0 %d %d 0 #%s' % (width, height, line))
-    print('\t 0 0 %d %d 0' % (width, height))
+import box_batch
+import image_size
+
+
+def read_gt(txt):
+    """Read the single (NFC normalized) line of a ground truth text file."""
+    with io.open(txt, 'r', encoding='utf-8') as f:
+        lines = f.read().strip().split('\n')
+        if len(lines) != 1:
+            raise ValueError(
+                'ERROR: %s: Ground truth text file should contain exactly one line, not %s'
+                % (txt, len(lines))
+            )
+        return unicodedata.normalize('NFC', lines[0].strip())
+
+
+def box_lines(line, width, height, page=0):
+    """Generate WordStr line boxes for Indic & RTL."""
+    if line:
+        line = bidi.algorithm.get_display(line)
+        yield 'WordStr 0 0 %d %d %d #%s' % (width, height, page, line)
+        yield '\t 0 0 %d %d %d' % (width, height, page)
+
+
+def write_box(image, txt, out):
+    # Get image size.
+    width, height = image_size.get_size(image)
+
+    # load gt
+    line = read_gt(txt)
+
+    for box in box_lines(line, width, height):
+        print(box, file=out)
+
+
+def main():
+    #
+    # command line arguments
+    #
+    arg_parser = argparse.ArgumentParser(
+        """Creates tesseract WordStr box files for given (line) image text pairs"""
+    )
+
+    # Text ground truth
+    arg_parser.add_argument(
+        '-t',
+        '--txt',
+        nargs='?',
+        metavar='TXT',
+        help='Line text (GT)',
+    )
+
+    # Image file
+    arg_parser.add_argument(
+        '-i',
+        '--image',
+        nargs='?',
+        metavar='IMAGE',
+        help='Image file',
+    )
+
+    # Batch mode
+    box_batch.add_arguments(arg_parser)
+
+    args = arg_parser.parse_args()
+
+    #
+    # main
+    #
+
+    if box_batch.is_batch(args):
+        sys.exit(box_batch.run(write_box, args))
+    if not args.txt or not args.image:
+        arg_parser.error('the following arguments are required: -t/--txt, -i/--image')
+    image_size.open_cache(args.size_cache)
+    write_box(args.image, args.txt, sys.stdout)
+    image_size.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+"""
+Image dimension probing for the box generators.
+
+The box scripts only need the width and height of each line image. These
+are read from the TIFF or PNG header bytes instead of going through the PIL
+plugin machinery (which is still used as a fallback for other formats).
+
+Results can be kept in a persistent cache file which maps
+(path, mtime, size) to (width, height) and is shared by all box
+generators, so regenerating box files after a correction of the ground
+truth text only has to stat the image files.
+"""
+
+import io
+import os
+import sqlite3
+import struct
+import sys
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# TIFF tags and field types needed to find the image size.
+TIFF_IMAGE_WIDTH = 256
+TIFF_IMAGE_LENGTH = 257
+TIFF_SHORT = 3
+TIFF_LONG = 4
+TIFF_LONG8 = 16
+
+_cache = None
+
+
+def _probe_png(f, header):
+    if header[12:16] != b'IHDR' or len(header) < 24:
+        return None
+    return struct.unpack('>II', header[16:24])
+
+
+def _probe_tiff(f, header):
+    order = '<' if header[:2] == b'II' else '>'
+    (version,) = struct.unpack(order + 'H', header[2:4])
+    if version == 42:
+        (ifd_offset,) = struct.unpack(order + 'I', header[4:8])
+        count_format, entry_size, value_pos = 'H', 12, 8
+    elif version == 43:
+        # BigTIFF
+        (ifd_offset,) = struct.unpack(order + 'Q', header[8:16])
+        count_format, entry_size, value_pos = 'Q', 20, 12
+    else:
+        return None
+
+    f.seek(ifd_offset)
+    count_size = struct.calcsize(count_format)
+    (count,) = struct.unpack(order + count_format, f.read(count_size))
+    entries = f.read(count * entry_size)
+    width = height = None
+    for i in range(0, len(entries) - entry_size + 1, entry_size):
+        tag, field_type = struct.unpack(order + 'HH', entries[i : i + 4])
+        if tag not in (TIFF_IMAGE_WIDTH, TIFF_IMAGE_LENGTH):
+            continue
+        # Values which fit into the entry are stored left-justified in it.
+        value = entries[i + value_pos : i + entry_size]
+        if field_type == TIFF_SHORT:
+            (value,) = struct.unpack(order + 'H', value[:2])
+        elif field_type == TIFF_LONG:
+            (value,) = struct.unpack(order + 'I', value[:4])
+        elif field_type == TIFF_LONG8:
+            (value,) = struct.unpack(order + 'Q', value[:8])
+        else:
+            return None
+        if tag == TIFF_IMAGE_WIDTH:
+            width = value
+        else:
+            height = value
+    if width is None or height is None:
+        return None
+    return width, height
+
+
+def probe_header(f):
+    """
+    Return (width, height) from the header of the TIFF or PNG image in the
+    binary file object f, or None if the format is not recognized.
+    """
+    header = f.read(24)
+    if header.startswith(PNG_SIGNATURE):
+        return _probe_png(f, header)
+    if header[:4] in (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+'):
+        return _probe_tiff(f, header)
+    return None
+
+
+def probe_size(image):
+    """Return (width, height) of an image file (or of its bytes)."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        f = io.BytesIO(image)
+    else:
+        f = open(image, 'rb')
+    with f:
+        try:
+            size = probe_header(f)
+        except struct.error:
+            size = None
+        if size is None:
+            # Unknown or unusual format: let PIL figure it out.
+            from PIL import Image
+
+            f.seek(0)
+            size = Image.open(f).size
+    return tuple(size)
+
+
+class SizeCache:
+    """Persistent (path, mtime, size) -> (width, height) cache."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.pending = {}
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            dirname = os.path.dirname(os.path.abspath(self.filename))
+            os.makedirs(dirname, exist_ok=True)
+            self._db = sqlite3.connect(self.filename, timeout=60)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS sizes ('
+                'path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, '
+                'width INTEGER, height INTEGER)'
+            )
+        return self._db
+
+    def get_size(self, image):
+        path = os.path.abspath(image)
+        st = os.stat(path)
+        row = (
+            self._connect()
+            .execute(
+                'SELECT width, height FROM sizes '
+                'WHERE path = ? AND mtime_ns = ? AND size = ?',
+                (path, st.st_mtime_ns, st.st_size),
+            )
+            .fetchone()
+        )
+        if row:
+            return row
+        width, height = probe_size(path)
+        self.pending[path] = (st.st_mtime_ns, st.st_size, width, height)
+        return width, height
+
+    def take_pending(self):
+        """Return and forget the entries which are not stored yet."""
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def store(self, entries):
+        if not entries:
+            return
+        db = self._connect()
+        with db:
+            db.executemany(
+                'INSERT OR REPLACE INTO sizes VALUES (?, ?, ?, ?, ?)',
+                ((path, *entry) for path, entry in entries.items()),
+            )
+
+    def flush(self):
+        self.store(self.take_pending())
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def open_cache(filename):
+    """Use the given cache file for all following get_size() calls."""
+    global _cache
+    _cache = SizeCache(filename) if filename else None
+    return _cache
+
+
+def get_size(image):
+    """Return (width, height) of an image file, using the cache if opened."""
+    if _cache is None:
+        return probe_size(image)
+    return _cache.get_size(image)
+
+
+def take_pending():
+    return _cache.take_pending() if _cache is not None else {}
+
+
+def flush():
+    if _cache is not None:
+        _cache.flush()
+
+
+if __name__ == '__main__':
+    for arg in sys.argv[1:]:
+        print('%s\t%d\t%d' % (arg, *probe_size(arg)))
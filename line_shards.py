@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+"""
+Packed shards of line images and their ground truth.
+
+Instead of one image file and one .gt.txt file per line, samples are stored
+in uncompressed tar files (webdataset style). All members of a sample share
+its key:
+
+    KEY.tif (or KEY.png)   image bytes
+    KEY.gt.txt             ground truth text
+    KEY.json               metadata (optional)
+
+Next to every SHARD.tar, SHARD.tar.idx lists the offset and size of each
+member per sample (one JSON object per line), so single samples can be read
+without scanning the tar file. Shards are written under a temporary name and
+renamed once their index is complete.
+
+For training, a shard is exported to one multipage TIFF with a box file
+which numbers the pages, so tesseract creates one .lstmf file per shard:
+
+    line_shards.py pack data/foo-ground-truth data/foo-shards
+    line_shards.py export --box-script generate_line_box.py data/foo-shards/foo-00000.tar data/foo/shards/foo-00000
+"""
+
+import argparse
+import importlib
+import io
+import json
+import os
+import sys
+import tarfile
+import unicodedata
+
+import image_size
+
+INDEX_SUFFIX = '.idx'
+IMAGE_SUFFIXES = ('.tif', '.png')
+
+
+class ShardWriter:
+    """
+    Write samples to PREFIX-NNNNN.tar shards in directory with at most
+    max_samples samples each, starting with shard number start. With
+    max_samples None, shards are only finished by close().
+    """
+
+    def __init__(self, directory, prefix='shard', max_samples=10000, start=0):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_samples = max_samples
+        self.next_shard = start
+        self.paths = []
+        self._tar = None
+        self._index = []
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        """Number of samples in the current shard."""
+        return len(self._index)
+
+    @property
+    def full(self):
+        return self.max_samples is not None and len(self._index) >= self.max_samples
+
+    def _open(self):
+        self.path = os.path.join(
+            self.directory, '%s-%05d.tar' % (self.prefix, self.next_shard)
+        )
+        self.next_shard += 1
+        self._tar = tarfile.open(self.path + '.tmp', 'w', format=tarfile.GNU_FORMAT)
+        self._index = []
+
+    def _add_member(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        self._tar.addfile(info, io.BytesIO(data))
+        # The data ends at the current offset, padded to whole blocks.
+        padded = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        return [self._tar.offset - padded, len(data)]
+
+    def add(self, key, image, image_suffix, text, metadata=None):
+        """Add a sample with the image bytes, ground truth text and metadata."""
+        if self._tar is None:
+            self._open()
+        members = {
+            image_suffix: self._add_member(key + image_suffix, image),
+            '.gt.txt': self._add_member(key + '.gt.txt', text.encode('utf-8')),
+        }
+        if metadata is not None:
+            data = json.dumps(metadata, ensure_ascii=False).encode('utf-8')
+            members['.json'] = self._add_member(key + '.json', data)
+        self._index.append({'key': key, 'members': members})
+        if self.full:
+            self.close()
+
+    def close(self):
+        """Finish the current shard (the next sample starts a new one)."""
+        if self._tar is None:
+            return
+        self._tar.close()
+        with open(self.path + INDEX_SUFFIX, 'w', encoding='utf-8') as f:
+            for entry in self._index:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(self.path + '.tmp', self.path)
+        self.paths.append(self.path)
+        self._tar = None
+        self._index = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Sample:
+    def __init__(self, key, image, image_suffix, text, metadata):
+        self.key = key
+        self.image = image
+        self.image_suffix = image_suffix
+        self.text = text
+        self.metadata = metadata
+
+
+class ShardReader:
+    """Random access to the samples of one shard through its index."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        if os.path.exists(path + INDEX_SUFFIX):
+            with open(path + INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.index[entry['key']] = entry['members']
+        else:
+            self._scan()
+        self._file = open(path, 'rb')
+
+    def _scan(self):
+        # Shards from other tools may come without an index.
+        with tarfile.open(self.path, 'r:') as tar:
+            for info in tar:
+                if not info.isfile():
+                    continue
+                for suffix in IMAGE_SUFFIXES + ('.gt.txt', '.json'):
+                    if info.name.endswith(suffix):
+                        key = info.name[: -len(suffix)]
+                        self.index.setdefault(key, {})[suffix] = [info.offset_data, info.size]
+                        break
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return list(self.index)
+
+    def read(self, key, suffix):
+        offset, size = self.index[key][suffix]
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def sample(self, key):
+        members = self.index[key]
+        image_suffix = next(s for s in IMAGE_SUFFIXES if s in members)
+        metadata = json.loads(self.read(key, '.json')) if '.json' in members else None
+        return Sample(
+            key,
+            self.read(key, image_suffix),
+            image_suffix,
+            self.read(key, '.gt.txt').decode('utf-8'),
+            metadata,
+        )
+
+    def __iter__(self):
+        for key in self.index:
+            yield self.sample(key)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def normalize_gt(text, name):
+    """Same checks and normalization as read_gt() of the box scripts."""
+    lines = text.strip().split('\n')
+    if len(lines) != 1:
+        raise ValueError(
+            'ERROR: %s: Ground truth text should contain exactly one line, not %s'
+            % (name, len(lines))
+        )
+    return unicodedata.normalize('NFC', lines[0].strip())
+
+
+def export(shard, outbase, box_script):
+    """
+    Write the samples of a shard to OUTBASE.tif (one page per sample),
+    OUTBASE.box (boxes with page numbers, created with box_lines() of the
+    given box script) and OUTBASE.gt.txt (one line per sample).
+    """
+    from PIL import Image, TiffImagePlugin
+
+    box_module = importlib.import_module(os.path.splitext(os.path.basename(box_script))[0])
+    with ShardReader(shard) as reader, TiffImagePlugin.AppendingTiffWriter(
+        outbase + '.tif', new=True
+    ) as tif, open(outbase + '.box.tmp', 'w', encoding='utf-8', newline='\n') as box, open(
+        outbase + '.gt.txt.tmp', 'w', encoding='utf-8', newline='\n'
+    ) as gt:
+        for page, sample in enumerate(reader):
+            line = normalize_gt(sample.text, '%s:%s' % (shard, sample.key))
+            width, height = image_size.probe_size(sample.image)
+            for box_line in box_module.box_lines(line, width, height, page):
+                print(box_line, file=box)
+            print(line, file=gt)
+            # Pages are written one by one to keep memory bounded.
+            image = Image.open(io.BytesIO(sample.image))
+            image.save(tif, format='TIFF', compression='tiff_lzw')
+            tif.newFrame()
+    os.replace(outbase + '.box.tmp', outbase + '.box')
+    # Written last: the Makefile uses it as the target of the export.
+    os.replace(outbase + '.gt.txt.tmp', outbase + '.gt.txt')
+
+
+def pack(ground_truth_dir, shard_dir, prefix, max_samples):
+    """Pack the line images and .gt.txt files of a ground truth directory."""
+    import box_batch
+
+    count = 0
+    with ShardWriter(shard_dir, prefix, max_samples) as writer:
+        for image, txt, _ in box_batch.find_pairs(ground_truth_dir):
+            key = os.path.relpath(txt[: -len('.gt.txt')], ground_truth_dir)
+            suffix = '.png' if image.endswith('.png') else '.tif'
+            with open(image, 'rb') as f:
+                image_bytes = f.read()
+            with open(txt, 'r', encoding='utf-8') as f:
+                text = f.read()
+            writer.add(key.replace(os.sep, '/'), image_bytes, suffix, text)
+            count += 1
+    return count, writer.paths
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='Pack line images and ground truth into shards, or export shards for training'
+    )
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+
+    pack_parser = commands.add_parser('pack', help='Pack a ground truth directory into shards')
+    pack_parser.add_argument('ground_truth_dir')
+    pack_parser.add_argument('shard_dir')
+    pack_parser.add_argument('--prefix', default='shard', help='Shard file name prefix')
+    pack_parser.add_argument(
+        '--max-samples', type=int, default=10000, help='Maximum number of samples per shard'
+    )
+
+    export_parser = commands.add_parser(
+        'export', help='Export a shard as multipage TIFF, box and ground truth text'
+    )
+    export_parser.add_argument('shard')
+    export_parser.add_argument('outbase')
+    export_parser.add_argument(
+        '--box-script', default='generate_line_box.py', help='Box script providing box_lines()'
+    )
+
+    list_parser = commands.add_parser('list', help='List the keys and texts of a shard')
+    list_parser.add_argument('shard')
+
+    args = arg_parser.parse_args()
+
+    if args.command == 'pack':
+        count, paths = pack(args.ground_truth_dir, args.shard_dir, args.prefix, args.max_samples)
+        print('%d samples packed into %d shards' % (count, len(paths)), file=sys.stderr)
+    elif args.command == 'export':
+        export(args.shard, args.outbase, args.box_script)
+    else:
+        with ShardReader(args.shard) as reader:
+            for sample in reader:
+                print('%s\t%s' % (sample.key, sample.text.strip()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Character, grapheme cluster and word error rates for OCR results.
+
+Error rates are based on the Levenshtein distance, computed with the
+bit-parallel algorithm of Myers (in the formulation of Hyyrö), which needs
+O(n * ceil(m / w)) operations instead of the O(n * m) of the classic
+dynamic programming table. Python integers serve as arbitrarily long bit
+vectors, so the same kernel works for sequences of code points, grapheme
+clusters or words.
+"""
+
+import json
+import unicodedata
+
+from generate_line_syllable_box import splitclusters
+
+LEVELS = ('chars', 'clusters', 'words')
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two sequences of hashable items."""
+    # The shorter sequence is the pattern encoded in the bit vectors.
+    if len(a) > len(b):
+        a, b = b, a
+    m = len(a)
+    if m == 0:
+        return len(b)
+
+    peq = {}
+    for i, item in enumerate(a):
+        peq[item] = peq.get(item, 0) | (1 << i)
+
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv = full
+    mv = 0
+    score = m
+    for item in b:
+        eq = peq.get(item, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv & full
+    return score
+
+
+def normalize(text):
+    """NFC normalize text and collapse all whitespace to single spaces."""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def tokenize(text):
+    """Split normalized text into code points, grapheme clusters and words."""
+    return {
+        'chars': list(text),
+        'clusters': list(splitclusters(text)),
+        'words': text.split(),
+    }
+
+
+def score(ocr_text, gt_text):
+    """
+    Compare OCR output with the ground truth.
+
+    Returns a dictionary with the number of errors (edit operations) and the
+    length of the ground truth for each level.
+    """
+    ocr = tokenize(normalize(ocr_text))
+    gt = tokenize(normalize(gt_text))
+    result = {}
+    for level in LEVELS:
+        result[f'{level}_errors'] = edit_distance(ocr[level], gt[level])
+        result[f'{level}_total'] = len(gt[level])
+    return result
+
+
+def error_rate(errors, total):
+    """Error rate in percent (100 if there is no ground truth but output)."""
+    if total == 0:
+        return 0.0 if errors == 0 else 100.0
+    return 100.0 * errors / total
+
+
+class Accumulator:
+    """Running totals of the scores for one model."""
+
+    def __init__(self):
+        self.count = 0
+        self.failed = 0
+        self.errors = dict.fromkeys(LEVELS, 0)
+        self.totals = dict.fromkeys(LEVELS, 0)
+
+    def add(self, result):
+        self.count += 1
+        if 'error' in result:
+            self.failed += 1
+        for level in LEVELS:
+            self.errors[level] += result.get(f'{level}_errors', 0)
+            self.totals[level] += result.get(f'{level}_total', 0)
+
+    def rate(self, level):
+        return error_rate(self.errors[level], self.totals[level])
+
+    @property
+    def cer(self):
+        return self.rate('chars')
+
+    @property
+    def cluster_er(self):
+        return self.rate('clusters')
+
+    @property
+    def wer(self):
+        return self.rate('words')
+
+
+class ResultWriter:
+    """Stream per-sample results to a JSON lines file."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = open(self.path, 'w', encoding='utf-8')
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,20 +1,42 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import sys
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-plotfile = sys.argv[1]
-modelname = sys.argv[2]
-
-ytsvfile =  sys.argv[3] # "iteration.tsv"
-ctsvfile =  sys.argv[4] # "checkpoint.tsv"
-etsvfile =  sys.argv[5] # "eval.tsv" - Not used as no training iterations number
-stsvfile =  sys.argv[6] # "sub.tsv"
-ltsvfile =  sys.argv[7] # "lstmeval.tsv"
+import plot_follow
+
+arg_parser = argparse.ArgumentParser(
+    description='Plot the character error rate over training iterations')
+arg_parser.add_argument('plotfile')
+arg_parser.add_argument('modelname')
+arg_parser.add_argument('tsvfiles', nargs='*',
+    help='iteration.tsv checkpoint.tsv eval.tsv sub.tsv lstmeval.tsv (not used with --follow)')
+plot_follow.add_arguments(arg_parser)
+args = arg_parser.parse_args()
+
+plotfile = args.plotfile
+modelname = args.modelname
+
+if args.follow:
+    # eval is not shown as the log has no training iterations number for it
+    plot_follow.follow(args, 'TrainingIteration',
+        'character error rate over training iterations - from lstmtraining',
+        ('iteration', 'checkpoint', 'sub'))
+    sys.exit(0)
+
+if len(args.tsvfiles) != 5:
+    arg_parser.error('expected 5 TSV files')
+
+ytsvfile =  args.tsvfiles[0] # "iteration.tsv"
+ctsvfile =  args.tsvfiles[1] # "checkpoint.tsv"
+etsvfile =  args.tsvfiles[2] # "eval.tsv" - Not used as no training iterations number
+stsvfile =  args.tsvfiles[3] # "sub.tsv"
+ltsvfile =  args.tsvfiles[4] # "lstmeval.tsv"
 
 maxticks=10
 
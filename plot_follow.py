@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Follow mode shared by plot_cer.py and plot_log.py.
+
+Instead of plotting the TSV files once, the training log is tailed with
+training_log.LogReader while lstmtraining is running. New points are added
+to the series in place, and at a fixed interval the figure is written to the
+PNG file (and optionally to a static HTML page which reloads itself).
+
+The iteration and subtrainer series get a point every 100 iterations, so
+they are downsampled to keep memory and drawing time bounded for long runs.
+"""
+
+import html
+import os
+import sys
+import time
+
+import matplotlib.ticker
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import training_log
+
+# Series with a point every 100 iterations.
+DENSE_SERIES = ('iteration', 'sub')
+
+
+def add_arguments(arg_parser):
+    """Add the follow mode options to the argument parser of a plot script."""
+    arg_parser.add_argument(
+        '--follow',
+        metavar='LOG',
+        help='Tail this lstmtraining log and refresh the plot while training runs',
+    )
+    arg_parser.add_argument(
+        '--interval',
+        type=float,
+        default=60,
+        help='Seconds between refreshes in follow mode (default: %(default)s)',
+    )
+    arg_parser.add_argument(
+        '--max-points',
+        type=int,
+        default=5000,
+        help='Maximum number of points kept for the dense series in follow mode '
+        '(default: %(default)s)',
+    )
+    arg_parser.add_argument(
+        '--html',
+        metavar='FILE',
+        help='Also write a static HTML page showing the plot in follow mode',
+    )
+
+
+class DownsampledSeries:
+    """
+    (x, y) points keeping at most max_points.
+
+    Every stride-th point is kept. When the buffer is full, every other point
+    is dropped and the stride is doubled, so the points stay evenly spread
+    over the whole run. The last point added is always available.
+    """
+
+    def __init__(self, max_points):
+        self.max_points = max(2, max_points)
+        self.stride = 1
+        self.seen = 0
+        self.x = []
+        self.y = []
+        self.last = None
+
+    def clear(self):
+        self.__init__(self.max_points)
+
+    def append(self, x, y):
+        self.last = (x, y)
+        if self.seen % self.stride == 0:
+            self.x.append(x)
+            self.y.append(y)
+            if len(self.x) >= self.max_points:
+                del self.x[1::2]
+                del self.y[1::2]
+                self.stride *= 2
+        self.seen += 1
+
+    def data(self):
+        """Return the kept points plus the last one added."""
+        if self.last is None or (self.x and self.x[-1] == self.last[0]):
+            return self.x, self.y
+        return self.x + [self.last[0]], self.y + [self.last[1]]
+
+
+class FullSeries(DownsampledSeries):
+    """(x, y) points which are all kept (for the sparse series)."""
+
+    def __init__(self, max_points=None):
+        self.x = []
+        self.y = []
+        self.last = None
+
+    def clear(self):
+        self.__init__()
+
+    def append(self, x, y):
+        self.last = (x, y)
+        self.x.append(x)
+        self.y.append(y)
+
+
+class Dashboard:
+    """Figure with one artist per series, updated in place."""
+
+    # series: (CER column, color, label, line style)
+    STYLES = {
+        'iteration': ('IterationCER', 'teal', 'Training BCER', '-'),
+        'checkpoint': ('CheckpointCER', 'teal', 'BCER at checkpoints - lstmtraining - list.train', 'x'),
+        'eval': ('EvalCER', 'magenta', 'Validation BCER', '.-'),
+        'sub': ('SubtrainerCER', 'orange', 'SubTrainer BCER', '-'),
+    }
+
+    def __init__(self, modelname, x_column, title, series, max_points):
+        self.x_column = x_column
+        self.series = {
+            name: (DownsampledSeries if name in DENSE_SERIES else FullSeries)(max_points)
+            for name in series
+        }
+        self.changed = set()
+
+        self.fig = Figure(figsize=(11, 8.5))  # size is in inches
+        self.canvas = FigureCanvasAgg(self.fig)
+        ax = self.ax = self.fig.add_subplot()
+        ax.yaxis.set_major_formatter(matplotlib.ticker.FormatStrFormatter('%.1f'))
+        ax.set_ylabel('Error Rate %')
+        ax.set_xlabel('Training Iterations' if x_column == 'TrainingIteration' else 'Learning Iterations')
+        ax.tick_params(axis='x', labelsize='small')
+        ax.xaxis.set_major_formatter(matplotlib.ticker.StrMethodFormatter('{x:,.0f}'))
+        ax.grid(True)
+        ax.set_ylim([-0.5, 100])
+        ax.set_title(title, fontsize=10)
+        self.fig.suptitle('Tesseract LSTM Training : ' + modelname, y=0.95, fontsize=14, fontweight='bold')
+
+        self.artists = {}
+        for name in series:
+            column, color, label, style = self.STYLES[name]
+            if style == 'x':
+                (artist,) = ax.plot([], [], 'x', color=color, markersize=6, alpha=0.5, label=label)
+            elif style == '.-':
+                (artist,) = ax.plot([], [], '.-', color=color, linewidth=1.0, alpha=0.7, label=label)
+            else:
+                (artist,) = ax.plot([], [], '-', color=color, linewidth=0.5, alpha=0.7, label=label)
+            self.artists[name] = artist
+        ax.legend(loc='upper right')
+        self.best = ax.annotate(
+            '', xy=(0, 0), xytext=(-80, 50), textcoords='offset points', fontsize=9,
+            arrowprops=dict(shrinkA=1, shrinkB=1, fc='teal', alpha=0.7, ec='white'),
+            bbox=dict(boxstyle='round,pad=0.2', fc='teal', alpha=0.3), visible=False,
+        )
+
+    def clear(self):
+        for name, series in self.series.items():
+            series.clear()
+            self.changed.add(name)
+
+    def extend(self, found):
+        for name, row in found:
+            if name not in self.series:
+                continue
+            x = row.get(self.x_column)
+            if x is None:
+                continue
+            self.series[name].append(x, row[self.STYLES[name][0]])
+            self.changed.add(name)
+
+    def best_checkpoint(self):
+        series = self.series.get('checkpoint')
+        if not series or not series.y:
+            return None
+        i = min(range(len(series.y)), key=series.y.__getitem__)
+        return series.x[i], series.y[i]
+
+    def update(self):
+        """Update the artists of the series with new points. Returns False if there are none."""
+        if not self.changed:
+            return False
+        for name in self.changed:
+            self.artists[name].set_data(*self.series[name].data())
+        if 'checkpoint' in self.changed:
+            best = self.best_checkpoint()
+            if best:
+                self.best.xy = best
+                self.best.set_text(' {:.3f}% at {:,} '.format(best[1], best[0]))
+                self.best.set_visible(True)
+        self.changed.clear()
+        self.ax.relim()
+        self.ax.autoscale_view(scalex=True, scaley=False)
+        return True
+
+    def summary(self):
+        rows = []
+        for name, series in self.series.items():
+            if series.last:
+                rows.append((self.STYLES[name][2], '{:,}'.format(series.last[0]), '{:.3f}%'.format(series.last[1])))
+        best = self.best_checkpoint()
+        if best:
+            rows.append(('Best checkpoint', '{:,}'.format(best[0]), '{:.3f}%'.format(best[1])))
+        return rows
+
+    def save(self, plotfile):
+        tmp = plotfile + '.tmp.png'
+        self.fig.savefig(tmp)
+        os.replace(tmp, plotfile)
+
+
+def write_html(filename, plotfile, modelname, rows, interval):
+    """Write a static page which shows the plot and reloads itself."""
+    image = os.path.relpath(os.path.abspath(plotfile), os.path.dirname(os.path.abspath(filename)))
+    table = '\n'.join(
+        '<tr><td>%s</td><td>%s</td><td>%s</td></tr>' % tuple(html.escape(v) for v in row)
+        for row in rows
+    )
+    page = f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta http-equiv="refresh" content="{max(1, int(interval))}">
+<title>{html.escape(modelname)} training</title>
+</head>
+<body>
+<p>Updated {time.strftime('%Y-%m-%d %H:%M:%S')}</p>
+<table>
+<tr><th>Series</th><th>Iteration</th><th>BCER</th></tr>
+{table}
+</table>
+<img src="{html.escape(image)}?{int(time.time())}" alt="{html.escape(modelname)}">
+</body>
+</html>
+"""
+    tmp = filename + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(page)
+    os.replace(tmp, filename)
+
+
+def follow(args, x_column, title, series):
+    """
+    Tail args.follow and refresh args.plotfile every args.interval seconds
+    until interrupted.
+    """
+    reader = training_log.LogReader(args.follow)
+    dashboard = Dashboard(args.modelname, x_column, title, series, args.max_points)
+    try:
+        while True:
+            found = reader.read()
+            if reader.restarted:
+                dashboard.clear()
+            dashboard.extend(found)
+            if dashboard.update():
+                dashboard.save(args.plotfile)
+                if args.html:
+                    write_html(args.html, args.plotfile, args.modelname, dashboard.summary(), args.interval)
+                print('%s: updated %s' % (time.strftime('%H:%M:%S'), args.plotfile), file=sys.stderr)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
@@ -1,19 +1,40 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import sys
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-plotfile = sys.argv[1]
-modelname = sys.argv[2]
-
-ytsvfile =  sys.argv[3] # "iteration.tsv"
-ctsvfile =  sys.argv[4] # "checkpoint.tsv"
-etsvfile =  sys.argv[5] # "eval.tsv"
-stsvfile =  sys.argv[6] # "sub.tsv"
+import plot_follow
+
+arg_parser = argparse.ArgumentParser(
+    description='Plot the character error rate over learning iterations')
+arg_parser.add_argument('plotfile')
+arg_parser.add_argument('modelname')
+arg_parser.add_argument('tsvfiles', nargs='*',
+    help='iteration.tsv checkpoint.tsv eval.tsv sub.tsv (not used with --follow)')
+plot_follow.add_arguments(arg_parser)
+args = arg_parser.parse_args()
+
+plotfile = args.plotfile
+modelname = args.modelname
+
+if args.follow:
+    plot_follow.follow(args, 'LearningIteration',
+        'character error rate over learning iterations - from lstmtraining',
+        ('iteration', 'checkpoint', 'eval', 'sub'))
+    sys.exit(0)
+
+if len(args.tsvfiles) != 4:
+    arg_parser.error('expected 4 TSV files')
+
+ytsvfile =  args.tsvfiles[0] # "iteration.tsv"
+ctsvfile =  args.tsvfiles[1] # "checkpoint.tsv"
+etsvfile =  args.tsvfiles[2] # "eval.tsv"
+stsvfile =  args.tsvfiles[3] # "sub.tsv"
 
 maxticks=4
 
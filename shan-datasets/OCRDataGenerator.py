@@ -1,8 +1,73 @@
 from PIL import Image, ImageDraw, ImageFont
+from functools import lru_cache
+import multiprocessing
+import os
 import random
 import numpy as np
 from typing import Tuple, Optional
 
+@lru_cache(maxsize=64)
+def load_font(font_path: str, font_size: int) -> ImageFont.FreeTypeFont:
+    """Load a font, keeping recently used (path, size) pairs in memory."""
+    return ImageFont.truetype(font_path, font_size)
+
+def sample_rngs(seed: int, idx: int, variant: int) -> Tuple[random.Random, np.random.Generator]:
+    """
+    Create the random generators for one sample of a dataset.
+
+    They only depend on (seed, idx, variant), so a sample is rendered the
+    same no matter which worker renders it or in which order.
+    """
+    seed_sequence = np.random.SeedSequence([seed, idx, variant])
+    state = seed_sequence.generate_state(4)
+    return random.Random(int.from_bytes(state.tobytes(), 'little')), np.random.default_rng(seed_sequence)
+
+_batch_worker = None
+
+def _init_batch_worker(generator, augmenter) -> None:
+    """Install the generator and augmenter once per worker, so the augmenter keeps its buffers."""
+    global _batch_worker
+    _batch_worker = (generator, augmenter)
+
+def _render_batch(args) -> list:
+    return render_batch(*_batch_worker, *args)
+
+def render_batch(generator, augmenter, output_dir: str, seed: int, batch_index: int,
+                 samples: list, kwargs: dict) -> list:
+    """Render, augment and save a batch of (idx, variant, text) samples."""
+    if augmenter is not None:
+        # Noise and skew are done by the augmenter for the whole batch.
+        kwargs = dict(kwargs, add_noise=False, random_transform=False)
+
+    images = []
+    dataset_info = []
+    for idx, variant, text in samples:
+        rng, np_rng = sample_rngs(seed, idx, variant)
+        img, metadata = generator.generate_image(text, rng=rng, np_rng=np_rng, **kwargs)
+        images.append(img)
+        dataset_info.append(metadata)
+
+    if augmenter is not None:
+        # Only lines with the same height and mode can be stacked.
+        groups = {}
+        for i, img in enumerate(images):
+            groups.setdefault((img.height, img.mode), []).append(i)
+        for group, (height, mode) in enumerate(sorted(groups)):
+            indices = groups[(height, mode)]
+            aug_rng = np.random.default_rng([seed, batch_index, group])
+            augmented = augmenter.augment([images[i] for i in indices], aug_rng)
+            for i, img in zip(indices, augmented):
+                images[i] = img
+
+    for (idx, variant, _), img, metadata in zip(samples, images, dataset_info):
+        # Save image
+        image_filename = f"{idx}_{variant}.png"
+        image_path = os.path.join(output_dir, image_filename)
+        img.save(image_path)
+
+        metadata['image_path'] = image_path
+    return dataset_info
+
 class OCRDataGenerator:
     def __init__(self, font_paths: list, 
                  bg_colors: list = [(255, 255, 255), (250, 250, 250), (245, 245, 245)],
@@ -46,16 +111,20 @@ class OCRDataGenerator:
         
         return width, height
 
-    def _add_noise(self, img: Image.Image, noise_factor: float = 0.02) -> Image.Image:
+    def _add_noise(self, img: Image.Image, noise_factor: float = 0.02,
+                   np_rng: Optional[np.random.Generator] = None) -> Image.Image:
         """Add random noise to the image."""
+        np_rng = np_rng or np.random
         img_array = np.array(img)
-        noise = np.random.normal(0, 255 * noise_factor, img_array.shape)
+        noise = np_rng.normal(0, 255 * noise_factor, img_array.shape)
         noisy_img_array = np.clip(img_array + noise, 0, 255).astype(np.uint8)
         return Image.fromarray(noisy_img_array)
 
-    def _apply_random_transform(self, img: Image.Image, max_skew: float = 2.0) -> Image.Image:
+    def _apply_random_transform(self, img: Image.Image, max_skew: float = 2.0,
+                                rng: Optional[random.Random] = None) -> Image.Image:
         """Apply random transformation (slight rotation and skew)."""
-        angle = random.uniform(-max_skew, max_skew)
+        rng = rng or random
+        angle = rng.uniform(-max_skew, max_skew)
         return img.rotate(angle, resample=Image.BICUBIC, expand=True)
 
     def generate_image(self, 
@@ -66,7 +135,9 @@ class OCRDataGenerator:
                       vertical_padding: int = 20,
                       min_height: int = 64,
                       add_noise: bool = True,
-                      random_transform: bool = True) -> Tuple[Image.Image, dict]:
+                      random_transform: bool = True,
+                      rng: Optional[random.Random] = None,
+                      np_rng: Optional[np.random.Generator] = None) -> Tuple[Image.Image, dict]:
         """
         Generate an image containing the given text with dynamic sizing.
         
@@ -79,18 +150,22 @@ class OCRDataGenerator:
             min_height: Minimum height of the image
             add_noise: Whether to add noise to the image
             random_transform: Whether to apply random transformations
+            rng: Random generator to use instead of the random module
+            np_rng: Random generator to use instead of numpy.random
             
         Returns:
             tuple: (Generated image, metadata dictionary)
         """
+        rng = rng or random
+
         # Randomly select parameters
-        font_path = random.choice(self.font_paths)
-        font_size = random.randint(min_font_size, max_font_size)
-        bg_color = random.choice(self.bg_colors)
-        text_color = random.choice(self.text_colors)
+        font_path = rng.choice(self.font_paths)
+        font_size = rng.randint(min_font_size, max_font_size)
+        bg_color = rng.choice(self.bg_colors)
+        text_color = rng.choice(self.text_colors)
         
         # Create font
-        font = ImageFont.truetype(font_path, font_size)
+        font = load_font(font_path, font_size)
         
         # Calculate appropriate image size
         image_size = self._calculate_image_size(
@@ -115,10 +190,10 @@ class OCRDataGenerator:
         
         # Apply transformations
         if random_transform:
-            img = self._apply_random_transform(img)
+            img = self._apply_random_transform(img, rng=rng)
             
         if add_noise:
-            img = self._add_noise(img)
+            img = self._add_noise(img, np_rng=np_rng)
         
         # Create metadata
         metadata = {
@@ -136,14 +211,28 @@ class OCRDataGenerator:
                         texts: list,
                         output_dir: str,
                         images_per_text: int = 1,
+                        seed: Optional[int] = None,
+                        workers: int = 1,
+                        augmenter=None,
+                        batch_size: int = 32,
                         **kwargs) -> list:
         """
         Generate a dataset of images from a list of texts.
+
+        Every image gets its own random generators derived from
+        (seed, idx, variant), so the same seed gives identical datasets for
+        any number of workers. Images are rendered in batches of batch_size,
+        which a BatchAugmenter (see augment.py) augments together; the
+        augmenter then replaces the add_noise and random_transform steps.
         
         Args:
             texts: List of texts to generate images for
             output_dir: Directory to save the images
             images_per_text: Number of images to generate per text
+            seed: Seed for the dataset (default: drawn from the random module)
+            workers: Number of worker processes (0 for all CPUs)
+            augmenter: Optional augment.BatchAugmenter for the rendered images
+            batch_size: Number of images rendered (and augmented) together
             **kwargs: Additional arguments to pass to generate_image
             
         Returns:
@@ -153,20 +242,31 @@ class OCRDataGenerator:
         import json
         
         os.makedirs(output_dir, exist_ok=True)
-        dataset_info = []
-        
-        for idx, text in enumerate(texts):
-            for variant in range(images_per_text):
-                img, metadata = self.generate_image(text, **kwargs)
-                
-                # Save image
-                image_filename = f"{idx}_{variant}.png"
-                image_path = os.path.join(output_dir, image_filename)
-                img.save(image_path)
-                
-                # Save metadata
-                metadata['image_path'] = image_path
-                dataset_info.append(metadata)
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+
+        samples = [
+            (idx, variant, text)
+            for idx, text in enumerate(texts)
+            for variant in range(images_per_text)
+        ]
+        # The batches only depend on batch_size, not on the number of workers.
+        tasks = (
+            (output_dir, seed, batch_index, samples[start:start + batch_size], kwargs)
+            for batch_index, start in enumerate(range(0, len(samples), batch_size))
+        )
+        if workers == 1:
+            results = (render_batch(self, augmenter, *task) for task in tasks)
+        else:
+            pool = multiprocessing.Pool(workers or None, initializer=_init_batch_worker,
+                                        initargs=(self, augmenter))
+            results = pool.imap(_render_batch, tasks)
+        try:
+            dataset_info = [metadata for batch in results for metadata in batch]
+        finally:
+            if workers != 1:
+                pool.close()
+                pool.join()
         
         # Save dataset metadata
         with open(os.path.join(output_dir, 'metadata.json'), 'w') as f:
@@ -0,0 +1,190 @@
+"""
+Batched augmentation of rendered line images.
+
+Instead of converting every image to a float64 array for the noise and
+rotating it with PIL, BatchAugmenter stacks line images of the same height
+into one float32 array (reusing its buffers between batches) and applies
+every augmentation to the whole batch at once:
+
+    background texture, skew, blur, erosion/dilation, Gaussian noise
+
+followed by JPEG compression artifacts for a part of the images. Each
+augmentation except the noise is applied to a random subset of the batch.
+"""
+
+import io
+import math
+
+import numpy as np
+from PIL import Image
+
+
+def _box_blur(a: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    """Mean over a window of 2 * radius + 1 along axis (edges replicated)."""
+    pad = [(0, 0)] * a.ndim
+    pad[axis] = (radius + 1, radius)
+    c = np.cumsum(np.pad(a, pad, mode='edge'), axis=axis, dtype=np.float32)
+    n = a.shape[axis]
+    upper = np.take(c, np.arange(2 * radius + 1, n + 2 * radius + 1), axis=axis)
+    lower = np.take(c, np.arange(0, n), axis=axis)
+    return (upper - lower) / (2 * radius + 1)
+
+
+def _min_max_filter(a: np.ndarray, reduce) -> np.ndarray:
+    """3x3 minimum or maximum filter over the rows and columns of a batch."""
+    p = np.pad(a, ((0, 0), (1, 1), (1, 1), (0, 0)), mode='edge')
+    h, w = a.shape[1:3]
+    rows = reduce(reduce(p[:, :-2], p[:, 1:-1]), p[:, 2:])
+    return reduce(reduce(rows[:, :, :w], rows[:, :, 1:w + 1]), rows[:, :, 2:])
+
+
+class BatchAugmenter:
+    def __init__(self,
+                 noise_factor: float = 0.02,
+                 max_skew: float = 2.0,
+                 skew_prob: float = 0.5,
+                 blur_prob: float = 0.3,
+                 morph_prob: float = 0.2,
+                 jpeg_prob: float = 0.2,
+                 jpeg_quality: tuple = (30, 90),
+                 texture_prob: float = 0.3,
+                 texture_strength: float = 0.15):
+        """
+        Args:
+            noise_factor: Standard deviation of the Gaussian noise (fraction of 255)
+            max_skew: Maximum skew angle in degrees
+            skew_prob: Fraction of images which are skewed
+            blur_prob: Fraction of images which are blurred
+            morph_prob: Fraction of images whose strokes are eroded or dilated
+            jpeg_prob: Fraction of images which get JPEG artifacts
+            jpeg_quality: Range of the JPEG quality
+            texture_prob: Fraction of images which get a background texture
+            texture_strength: Maximum darkening of the background by the texture
+        """
+        self.noise_factor = noise_factor
+        self.max_skew = max_skew
+        self.skew_prob = skew_prob
+        self.blur_prob = blur_prob
+        self.morph_prob = morph_prob
+        self.jpeg_prob = jpeg_prob
+        self.jpeg_quality = jpeg_quality
+        self.texture_prob = texture_prob
+        self.texture_strength = texture_strength
+        self._work = np.empty(0, np.float32)
+        self._noise = np.empty(0, np.float32)
+        self._out = np.empty(0, np.uint8)
+
+    def __getstate__(self):
+        # The buffers are not worth sending to worker processes.
+        state = self.__dict__.copy()
+        state['_work'] = state['_noise'] = np.empty(0, np.float32)
+        state['_out'] = np.empty(0, np.uint8)
+        return state
+
+    def _buffers(self, shape):
+        """Views of the preallocated buffers with the given shape (grown if needed)."""
+        size = math.prod(shape)
+        if self._work.size < size:
+            self._work = np.empty(size, np.float32)
+            self._noise = np.empty(size, np.float32)
+            self._out = np.empty(size, np.uint8)
+        return (self._work[:size].reshape(shape),
+                self._noise[:size].reshape(shape),
+                self._out[:size].reshape(shape))
+
+    def _texture(self, work, selected, rng):
+        n, h, w = len(selected), work.shape[1], work.shape[2]
+        # Coarse random grid, upsampled and smoothed to a cloudy texture.
+        cell = 16
+        grid = rng.random((n, h // cell + 1, w // cell + 1, 1), dtype=np.float32)
+        texture = np.repeat(np.repeat(grid, cell, axis=1), cell, axis=2)[:, :h, :w]
+        texture = _box_blur(_box_blur(texture, cell // 2, 1), cell // 2, 2)
+        strength = rng.uniform(0, self.texture_strength, n).astype(np.float32)
+        work[selected] *= 1 - strength[:, None, None, None] * texture
+
+    def _skew(self, work, selected, rng):
+        # Small rotations are approximated by shifting every column
+        # vertically, which keeps the size of the images.
+        n, h, w = len(selected), work.shape[1], work.shape[2]
+        slope = np.tan(np.radians(rng.uniform(-self.max_skew, self.max_skew, n)))
+        shift = np.rint(slope[:, None] * (np.arange(w) - w / 2)).astype(np.intp)
+        rows = np.clip(np.arange(h)[None, :, None] + shift[:, None, :], 0, h - 1)
+        work[selected] = np.take_along_axis(work[selected], rows[..., None], axis=1)
+
+    def _blur(self, work, selected):
+        work[selected] = _box_blur(_box_blur(work[selected], 1, 1), 1, 2)
+
+    def _morph(self, work, selected, rng):
+        # Text is dark: the minimum filter thickens, the maximum filter thins strokes.
+        erode = rng.random(len(selected)) < 0.5
+        if erode.any():
+            work[selected[erode]] = _min_max_filter(work[selected[erode]], np.minimum)
+        if (~erode).any():
+            work[selected[~erode]] = _min_max_filter(work[selected[~erode]], np.maximum)
+
+    def _jpeg(self, image: Image.Image, quality: int) -> Image.Image:
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality)
+        buffer.seek(0)
+        return Image.open(buffer).convert(image.mode)
+
+    def augment(self, images: list, rng: np.random.Generator) -> list:
+        """
+        Augment a batch of images with the same height and mode.
+
+        Args:
+            images: PIL images of the same height and mode
+            rng: Random generator for all random decisions of the batch
+
+        Returns:
+            list: Augmented PIL images with the same sizes as the inputs
+        """
+        if not images:
+            return []
+        n = len(images)
+        height = images[0].height
+        widths = [image.width for image in images]
+        channels = len(images[0].getbands())
+        work, noise, out = self._buffers((n, height, max(widths), channels))
+
+        # Stack the images, narrower ones are padded with their last column.
+        for i, image in enumerate(images):
+            array = np.asarray(image).reshape(height, image.width, channels)
+            work[i, :, :image.width] = array
+            work[i, :, image.width:] = array[:, -1:]
+
+        def choose(prob):
+            return np.flatnonzero(rng.random(n) < prob)
+
+        selected = choose(self.texture_prob)
+        if len(selected):
+            self._texture(work, selected, rng)
+        selected = choose(self.skew_prob)
+        if len(selected) and self.max_skew:
+            self._skew(work, selected, rng)
+        selected = choose(self.blur_prob)
+        if len(selected):
+            self._blur(work, selected)
+        selected = choose(self.morph_prob)
+        if len(selected):
+            self._morph(work, selected, rng)
+        if self.noise_factor:
+            rng.standard_normal(dtype=np.float32, out=noise)
+            noise *= 255 * self.noise_factor
+            work += noise
+
+        np.clip(work, 0, 255, out=work)
+        np.rint(work, out=work)
+        out[...] = work
+
+        jpeg = rng.random(n) < self.jpeg_prob
+        quality = rng.integers(self.jpeg_quality[0], self.jpeg_quality[1], n, endpoint=True)
+        results = []
+        for i, width in enumerate(widths):
+            # Copied, the output buffer is reused by the next batch.
+            array = out[i, :, :width, 0] if channels == 1 else out[i, :, :width]
+            image = Image.fromarray(array.copy())
+            if jpeg[i]:
+                image = self._jpeg(image, int(quality[i]))
+            results.append(image)
+        return results
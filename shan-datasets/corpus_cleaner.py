@@ -0,0 +1,235 @@
+"""
+Shan corpus cleaning.
+
+ShanTextCleaner holds the precompiled patterns and character classes used by
+clean_shan_text() in the dataset generators. Lines which only consist of
+allowed characters (the vast majority of a Shan corpus) are accepted by a
+single set operation; only the others go through the word tokenizer to drop
+the non-Shan words.
+
+Run as a script, a text file or a HuggingFace dataset is cleaned in a pool of
+worker processes and the cleaned, deduplicated lines are written to sharded
+output files:
+
+    python corpus_cleaner.py --input shannews.txt --output-dir cleaned
+    python corpus_cleaner.py --hf NorHsangPha/shan-news-shannews_org --output-dir cleaned
+"""
+
+import argparse
+import hashlib
+import itertools
+import multiprocessing
+import os
+import re
+import unicodedata
+
+from shannlp import word_tokenize, shan_characters, shan_digits
+
+EMOJI_PATTERN = re.compile("["
+    u"\U0001F600-\U0001F64F"  # emoticons
+    u"\U0001F300-\U0001F5FF"  # symbols & pictographs
+    u"\U0001F680-\U0001F6FF"  # transport & map symbols
+    u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
+    u"\U00002500-\U00002BEF"  # chinese char
+    u"\U00002702-\U000027B0"
+    u"\U000024C2-\U0001F251"
+    u"\U0001f926-\U0001f937"
+    u"\U00010000-\U0010ffff"
+    u"\u2640-\u2642"
+    u"\u2600-\u2B55"
+    u"\u200d"
+    u"\u23cf"
+    u"\u23e9"
+    u"\u231a"
+    u"\ufe0f"  # dingbats
+    u"\u3030"
+    "]+", re.UNICODE)
+
+MULTI_SPACE_PATTERN = re.compile(r"\s+")
+DUPLICATE_MARK_PATTERN = re.compile(r"ႉ{2,}")
+
+LATIN_DIGITS = "0123456789"
+MYANMAR_DIGITS = "".join(chr(c) for c in range(0x1040, 0x104a))
+
+# Characters kept by text2img_data_generator.py besides the Shan letters.
+TEXT2IMG_EXTRA_CHARS = LATIN_DIGITS + MYANMAR_DIGITS + shan_digits + "/-'\""
+
+
+class ShanTextCleaner:
+    """
+    Clean Shan text: remove emojis, Latin text and non-Shan (e.g. Burmese)
+    words and fix common typing errors.
+
+    extra_chars are kept in addition to the Myanmar block and do not make a
+    word non-Shan. With keep_numbers, Latin digits survive the final filter.
+    """
+
+    def __init__(self, keep_numbers=False, extra_chars="", normalize=True):
+        self.keep_numbers = keep_numbers
+        self.extra_chars = extra_chars
+        self.normalize = normalize
+
+        self.latin_pattern = re.compile(rf"[^\u1000-\u109f\s{re.escape(extra_chars)}]")
+        self.word_chars = frozenset(shan_characters + extra_chars + " ")
+        numbers = LATIN_DIGITS if keep_numbers else ""
+        self.final_pattern = re.compile(rf"[^{re.escape(numbers + shan_characters)}\s]")
+
+    def __reduce__(self):
+        # The compiled patterns are rebuilt in worker processes.
+        return (type(self), (self.keep_numbers, self.extra_chars, self.normalize))
+
+    def remove_latin_text(self, text):
+        return MULTI_SPACE_PATTERN.sub(" ", self.latin_pattern.sub("", text))
+
+    def remove_myanmar_text(self, text):
+        # Fast path: no word can be rejected, so the tokenizer is not needed.
+        if self.word_chars.issuperset(text):
+            return MULTI_SPACE_PATTERN.sub(" ", text).strip()
+        cleaned_words = []
+        for word in word_tokenize(text, engine="newmm"):
+            if all(char in self.word_chars or char.isspace() for char in word):
+                cleaned_words.append(word)
+        return MULTI_SPACE_PATTERN.sub(" ", "".join(cleaned_words)).strip()
+
+    def clean(self, text):
+        if self.normalize:
+            text = unicodedata.normalize("NFC", text)
+
+        text = EMOJI_PATTERN.sub("", text)
+
+        text = text.replace("၊", "၊ ").replace("။", "။ ").replace(" ၊", "၊ ").replace(" ။", "။ ").strip()
+        text = DUPLICATE_MARK_PATTERN.sub("ႉ", text)
+        text = text.replace("ႆၢ", "ၢႆ")
+        text = text.replace("ေတ", "တေ")
+
+        text = self.remove_latin_text(text)
+        text = self.remove_myanmar_text(text)
+
+        return self.final_pattern.sub("", text)
+
+
+class ShardWriter:
+    """Write lines to numbered shard files with at most shard_size lines each."""
+
+    def __init__(self, output_dir, prefix, shard_size):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shard = 0
+        self.lines = 0
+        self._file = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write(self, line):
+        if self._file is None or self.lines >= self.shard_size:
+            self.close()
+            path = os.path.join(self.output_dir, f"{self.prefix}-{self.shard:05d}.txt")
+            self._file = open(path, "w", encoding="utf-8")
+            self.shard += 1
+            self.lines = 0
+        self._file.write(line + "\n")
+        self.lines += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_text_file(path):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            yield line
+
+
+def read_hf_dataset(repo, column="content", split="train"):
+    from datasets import load_dataset
+
+    # Records are fetched lazily instead of loading the whole split.
+    for record in load_dataset(repo, split=split, streaming=True):
+        yield from (record[column] or "").splitlines()
+
+
+_cleaner = None
+
+
+def _init_worker(cleaner):
+    global _cleaner
+    _cleaner = cleaner
+
+
+def _clean_chunk(lines):
+    return [_cleaner.clean(line) for line in lines]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def clean_corpus(lines, output_dir, cleaner, prefix="cleaned", min_length=1,
+                 shard_size=100000, chunk_size=2000, jobs=None):
+    """
+    Clean lines in a process pool and write the unique results with at least
+    min_length characters to shards in output_dir.
+
+    Chunks are processed in order, so the output does not depend on the
+    number of workers. Returns (lines read, lines written).
+    """
+    seen = set()
+    read = written = 0
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(cleaner,)) as pool, \
+            ShardWriter(output_dir, prefix, shard_size) as writer:
+        for cleaned in pool.imap(_clean_chunk, chunked(lines, chunk_size)):
+            for line in cleaned:
+                read += 1
+                if len(line) < min_length:
+                    continue
+                # Keep 8 byte digests instead of the lines to bound memory.
+                digest = hashlib.blake2b(line.encode("utf-8"), digest_size=8).digest()
+                if digest in seen:
+                    continue
+                seen.add(digest)
+                writer.write(line)
+                written += 1
+    return read, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean and deduplicate a Shan text corpus")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Text file with one text per line")
+    source.add_argument("--hf", metavar="REPO", help="HuggingFace dataset repository")
+    parser.add_argument("--column", default="content", help="Text column of the dataset (default: %(default)s)")
+    parser.add_argument("--output-dir", required=True, help="Directory for the output shards")
+    parser.add_argument("--prefix", default="cleaned", help="File name prefix of the shards (default: %(default)s)")
+    parser.add_argument("--shard-size", type=int, default=100000, help="Lines per shard (default: %(default)s)")
+    parser.add_argument("--min-length", type=int, default=20, help="Drop shorter lines (default: %(default)s)")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of worker processes (default: all CPUs)")
+    parser.add_argument("--no-numbers", action="store_true", help="Remove Latin digits")
+    args = parser.parse_args()
+
+    if args.input:
+        lines = read_text_file(args.input)
+    else:
+        lines = read_hf_dataset(args.hf, column=args.column)
+
+    cleaner = ShanTextCleaner(keep_numbers=not args.no_numbers)
+    read, written = clean_corpus(lines, args.output_dir, cleaner, prefix=args.prefix,
+                                 min_length=args.min_length, shard_size=args.shard_size,
+                                 jobs=args.jobs)
+    print(f"{read} lines read, {written} unique lines written to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Font coverage index for the text2image generators.
+
+Reads the cmap of every font file in the fonts directory once with fontTools
+and keeps a code point bitmap per font, cached on disk next to the fontconfig
+cache and rebuilt when the listing of the fonts directory changes. Lines can
+then be checked against the fonts before text2image is started, instead of
+letting --strip_unrenderable_words silently drop words.
+
+FontScheduler uses the index to assign lines only to fonts which cover all
+of their characters, so that every font renders about the same number of
+characters.
+
+    python font_coverage.py fonts "PangLong Italic" "Shan"
+"""
+
+import argparse
+import base64
+import glob
+import json
+import os
+
+from tesstrain.cache import default_cache_dir, listing_digest
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+REGULAR_STYLES = ("Regular", "Normal", "Book")
+
+
+def font_name(ttfont):
+    """Return the Pango style name of a font, e.g. "Myanmar Text" or "PangLong Italic"."""
+    names = ttfont["name"]
+    family = names.getDebugName(16) or names.getDebugName(1)
+    style = names.getDebugName(17) or names.getDebugName(2)
+    return family if not style or style in REGULAR_STYLES else f"{family} {style}"
+
+
+def codepoint_bitmap(codepoints):
+    bitmap = bytearray(max(codepoints, default=0) // 8 + 1)
+    for cp in codepoints:
+        bitmap[cp >> 3] |= 1 << (cp & 7)
+    return bytes(bitmap)
+
+
+def bitmap_chars(bitmap):
+    return frozenset(chr(byte * 8 + bit)
+                     for byte, value in enumerate(bitmap) if value
+                     for bit in range(8) if value >> bit & 1)
+
+
+def scan_fonts(fonts_dir):
+    """Return {font name: (file name, code point bitmap)} for the fonts in fonts_dir."""
+    from fontTools.ttLib import TTCollection, TTFont
+
+    index = {}
+    for path in sorted(glob.glob(os.path.join(fonts_dir, "**", "*"), recursive=True)):
+        if not path.lower().endswith(FONT_EXTENSIONS):
+            continue
+        if path.lower().endswith(".ttc"):
+            fonts = TTCollection(path, lazy=True).fonts
+        else:
+            fonts = [TTFont(path, lazy=True)]
+        for ttfont in fonts:
+            cmap = ttfont.getBestCmap() or {}
+            index[font_name(ttfont)] = (os.path.relpath(path, fonts_dir), codepoint_bitmap(cmap))
+    return index
+
+
+class FontCoverage:
+    """Characters covered by each font of a fonts directory."""
+
+    def __init__(self, index):
+        self.files = {name: file for name, (file, _) in index.items()}
+        self.chars = {name: bitmap_chars(bitmap) for name, (_, bitmap) in index.items()}
+        self._resolved = {}
+
+    @classmethod
+    def load(cls, fonts_dir, cache_dir=None):
+        """Load the index of fonts_dir from the cache, or build and cache it."""
+        digest = listing_digest(fonts_dir)
+        path = os.path.join(cache_dir or default_cache_dir(), "font_coverage", digest[:16] + ".json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            index = {name: (file, base64.b64decode(bitmap)) for name, (file, bitmap) in cached.items()}
+        else:
+            index = scan_fonts(fonts_dir)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({name: (file, base64.b64encode(bitmap).decode("ascii"))
+                           for name, (file, bitmap) in index.items()}, f)
+            os.replace(path + ".tmp", path)
+        return cls(index)
+
+    def resolve(self, font):
+        """
+        Return the indexed font used for a text2image font name. Styles which
+        are not in the directory (e.g. "PangLong Italic") are synthesized by
+        Pango from the family, so the longest matching family is used.
+        """
+        if font not in self._resolved:
+            match = None
+            if font in self.chars:
+                match = font
+            else:
+                families = [name for name in self.chars if font.startswith(name + " ")]
+                if families:
+                    match = max(families, key=len)
+            self._resolved[font] = match
+        return self._resolved[font]
+
+    def missing(self, font, text):
+        """Return the set of characters of text (except whitespace) which font does not cover."""
+        resolved = self.resolve(font)
+        chars = self.chars[resolved] if resolved else frozenset()
+        return {char for char in set(text) - chars if not char.isspace()}
+
+    def covers(self, font, text):
+        resolved = self.resolve(font)
+        if resolved is None:
+            return False
+        # Fast path for the common case: one set operation in C.
+        return self.chars[resolved].issuperset(text) or not self.missing(font, text)
+
+
+class FontScheduler:
+    """
+    Assign lines to fonts, balancing the number of rendered characters.
+
+    Every line goes to the font with the fewest characters so far among the
+    fonts which cover it (ties go to the earlier font of the list). Lines are
+    assigned one by one in dataset order, so the fonts are interleaved and
+    every prefix of the dataset is balanced, and lines which are dropped
+    before scheduling do not skew the distribution.
+    """
+
+    def __init__(self, fonts, coverage=None):
+        self.fonts = list(fonts)
+        self.coverage = coverage
+        self.chars = dict.fromkeys(self.fonts, 0)
+        self.lines = dict.fromkeys(self.fonts, 0)
+
+    def assign(self, text):
+        """Return the font for text, or None if no font covers it."""
+        if self.coverage is None:
+            candidates = self.fonts
+        else:
+            candidates = [font for font in self.fonts if self.coverage.covers(font, text)]
+        if not candidates:
+            return None
+        font = min(candidates, key=self.chars.__getitem__)
+        self.chars[font] += sum(1 for char in text if not char.isspace())
+        self.lines[font] += 1
+        return font
+
+    def summary(self):
+        return ", ".join(f"{font}: {self.lines[font]} lines, {self.chars[font]} chars" for font in self.fonts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the coverage of a text by the fonts of a directory")
+    parser.add_argument("fonts_dir")
+    parser.add_argument("fonts", nargs="*", help="Font names (default: all fonts of the directory)")
+    parser.add_argument("--text", help="Text file to check, one line per sample")
+    args = parser.parse_args()
+
+    coverage = FontCoverage.load(args.fonts_dir)
+    fonts = args.fonts or sorted(coverage.chars)
+    if not args.text:
+        for font in fonts:
+            resolved = coverage.resolve(font)
+            size = len(coverage.chars[resolved]) if resolved else 0
+            print(f"{font}\t{coverage.files.get(resolved, '-')}\t{size} characters")
+        return
+
+    with open(args.text, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    for font in fonts:
+        missing = {}
+        for line in lines:
+            for char in coverage.missing(font, line):
+                missing[char] = missing.get(char, 0) + 1
+        covered = sum(1 for line in lines if coverage.covers(font, line))
+        top = " ".join(f"U+{ord(char):04X}" for char, _ in sorted(missing.items(), key=lambda item: -item[1])[:10])
+        print(f"{font}\t{covered}/{len(lines)} lines covered\t{top}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Persistent fontconfig cache for the text2image generators.
+
+text2image scans the fonts directory into a fontconfig cache on startup. The
+generators pass the cache directory of the tesstrain package (keyed by the
+listing of the fonts directory) as --fontconfig_tmpdir, so the scan is done
+once and shared with tesstrain runs using the same fonts, instead of being
+repeated by every text2image call.
+"""
+
+import os
+import subprocess
+import tempfile
+
+from tesstrain.cache import (
+    default_cache_dir,
+    fontconfig_cache_dir,
+    is_fontconfig_cache_ready,
+    mark_fontconfig_cache_ready,
+)
+
+
+def prepare_fontconfig_cache(fonts_dir, font, cache_dir=None):
+    """
+    Return the fontconfig cache directory for fonts_dir, warming it up with a
+    single text2image call if no earlier run did. Call it in the parent process
+    before starting workers, so they do not all scan the fonts at once.
+    """
+    path = fontconfig_cache_dir(cache_dir or default_cache_dir(), fonts_dir)
+    if not is_fontconfig_cache_ready(path):
+        with tempfile.TemporaryDirectory() as tmp:
+            sample = os.path.join(tmp, "sample_text.txt")
+            with open(sample, "w", encoding="utf-8") as f:
+                f.write("Text\n")
+            subprocess.run([
+                "text2image",
+                f"--font={font}",
+                f"--fonts_dir={fonts_dir}",
+                f"--text={sample}",
+                f"--outputbase={sample}",
+                f"--fontconfig_tmpdir={path}",
+            ], check=True)
+        mark_fontconfig_cache_ready(path)
+    return str(path)
@@ -1,74 +1,23 @@
-import time
-from OCRDataGenerator import OCRDataGenerator
+import argparse
+import collections
+import glob
+import io
+import json
+import multiprocessing
+import os
+import sys
+from OCRDataGenerator import OCRDataGenerator, sample_rngs
 from datasets import load_dataset
 import re
-import unicodedata
-from shannlp import word_tokenize, shan_characters
-
-def remove_emojis(data):
-    emoj = re.compile("["
-        u"\U0001F600-\U0001F64F"  # emoticons
-        u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-        u"\U0001F680-\U0001F6FF"  # transport & map symbols
-        u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-        u"\U00002500-\U00002BEF"  # chinese char
-        u"\U00002702-\U000027B0"
-        u"\U000024C2-\U0001F251"
-        u"\U0001f926-\U0001f937"
-        u"\U00010000-\U0010ffff"
-        u"\u2640-\u2642" 
-        u"\u2600-\u2B55"
-        u"\u200d"
-        u"\u23cf"
-        u"\u23e9"
-        u"\u231a"
-        u"\ufe0f"  # dingbats
-        u"\u3030"
-        "]+", re.UNICODE)
-    return re.sub(emoj, '', data)
-
-def remove_latin_text(text):
-    text = re.sub(r"[^\u1000-\u109f\s]", '', text)
-    text = re.sub(r"\s+", " ", text)
-    return text
-
-def remove_myanmar_text(text):
-    tokens = word_tokenize(text, engine="newmm")
-    cleaned_words = []
-    for word in tokens:
-        is_shan_word = True
-        for char in word:
-            if char not in shan_characters and not char.isspace():
-                is_shan_word = False
-                break
-        if is_shan_word:
-            cleaned_words.append(word)
-    
-    cleaned_text = "".join(cleaned_words)
-    
-    cleaned_text = re.sub(r'\s+', ' ', cleaned_text).strip()
-    
-    return cleaned_text
+from shannlp import word_tokenize
+from corpus_cleaner import ShanTextCleaner
+from sample_ids import ManifestWriter, manifest_entry, source_name, text_hash
 
-def clean_shan_text(text, keep_numbers=False):
-    # Normalize Unicode
-    text = unicodedata.normalize("NFC", text)
-    
-    text = remove_emojis(text)
-
-    text = text.replace("၊", "၊ ").replace("။", "။ ").replace(" ၊", "၊ ").replace(" ။", "။ ").strip()
-    text = re.sub(r"ႉ{2,}", "ႉ", text)
-    text = text.replace("ႆၢ", "ၢႆ")
-    text = text.replace("ေတ", "တေ")
+CLEANER = ShanTextCleaner()
+CLEANER_KEEP_NUMBERS = ShanTextCleaner(keep_numbers=True)
 
-    text = remove_latin_text(text)
-    text = remove_myanmar_text(text)
-    
-    # Latin Numbers
-    numbers = r"0-9" if keep_numbers else ""
-    text = re.sub(rf'[^{numbers}{shan_characters}\s]', '', text)
-    
-    return text
+def clean_shan_text(text, keep_numbers=False):
+    return (CLEANER_KEEP_NUMBERS if keep_numbers else CLEANER).clean(text)
 
 def split_shan_chunks(text, min_len=20, max_len=50):
     # Initial text preprocessing
@@ -138,29 +87,94 @@ def split_shan_chunks(text, min_len=20, max_len=50):
     
     return final_chunks
 
-def generate_images_from_huggingface(dataset_repo, chunk_size, fonts, output_dir):
-    generator = OCRDataGenerator(font_paths=fonts)
-    chunk_count = 0
-    
-    # Load dataset from Hugging Face
+# Per repo record offsets of interrupted generations, kept in the output dir.
+OFFSETS_FILE = ".hf_offsets.json"
+
+def read_offsets(output_dir):
+    path = os.path.join(output_dir, OFFSETS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_offsets(output_dir, offsets):
+    path = os.path.join(output_dir, OFFSETS_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(offsets, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def iter_parquet_contents(repo_dir, offset, batch_size):
+    """
+    Yield (index of first record, contents) batches from the Parquet files
+    of a downloaded dataset repo, starting at record offset.
+    """
+    import pyarrow.parquet as pq
+
+    files = sorted(glob.glob(os.path.join(repo_dir, "**", "*.parquet"), recursive=True))
+    if not files:
+        raise FileNotFoundError(f"No Parquet files found in {repo_dir}")
+    index = 0
+    for path in files:
+        parquet_file = pq.ParquetFile(path)
+        # Skip whole files before the offset using the metadata only.
+        if index + parquet_file.metadata.num_rows <= offset:
+            index += parquet_file.metadata.num_rows
+            continue
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=["content"]):
+            contents = batch.column("content").to_pylist()
+            if index + len(contents) > offset:
+                start = max(0, offset - index)
+                yield index + start, contents[start:]
+            index += len(contents)
+
+def iter_dataset_contents(dataset_repo, offset, batch_size):
+    """
+    Yield (index of first record, contents) batches of a HuggingFace dataset,
+    starting at record offset.
+
+    The dataset is memory mapped from the local Arrow cache, set
+    HF_DATASETS_OFFLINE=1 to use an already downloaded dataset without network.
+    """
     dataset = load_dataset(dataset_repo, split="train")
-    contents = dataset["content"]
+    for start in range(offset, len(dataset), batch_size):
+        yield start, dataset[start:start + batch_size]["content"]
 
-    print("Generate images...")
-    for content in contents:
-        content = content.strip()
+_generator = None
+
+def _init_worker(fonts):
+    global _generator
+    _generator = OCRDataGenerator(font_paths=fonts)
+
+def source_seed(source):
+    """Seed of a source, the same in every run."""
+    return int(text_hash(source), 16)
+
+def render_contents(args):
+    """
+    Render the chunks of a batch of records. Returns (next offset, manifest
+    entries, samples). Without output_dir, the images are not saved but
+    returned as (key, TIFF bytes, text) samples for the shard writer.
+    """
+    source, first_index, contents, output_dir = args
+    entries = []
+    samples = []
+    for i, content in enumerate(contents):
+        content = (content or "").strip()
         content = clean_shan_text(content, keep_numbers=True)
 
         texts = split_shan_chunks(content)
 
-        for text in texts:
+        for j, text in enumerate(texts):
             if len(text) < 1:
                 continue
-            
+
             text = re.sub(r"(^။)|(^၊)", "", text) # remove start ၊, ။
             text = text.strip()
 
-            image, metadata = generator.generate_image(
+            # A sample is rendered the same in every run and every worker,
+            # so resumed batches reproduce their images.
+            rng, np_rng = sample_rngs(source_seed(source), first_index + i, j)
+            image, metadata = _generator.generate_image(
                 text=text,
                 min_font_size=24,
                 max_font_size=48,
@@ -168,32 +182,148 @@ def generate_images_from_huggingface(dataset_repo, chunk_size, fonts, output_dir
                 vertical_padding=20,
                 min_height=64,
                 add_noise=True,
-                random_transform=False
+                random_transform=False,
+                rng=rng,
+                np_rng=np_rng
             )
-            print(f"Text: {text}")
-            print(f"Image size: {metadata['image_size']}\n")
 
-            ts = time.time()
+            # IDs derived from the record make reruns overwrite
+            # instead of duplicate the images of a resumed batch.
+            entry = manifest_entry(source, first_index + i, j, text, metadata["font"],
+                                   metadata["font_size"], image.size)
+            entries.append(entry)
+            key = entry["id"]
+
+            if output_dir is None:
+                buffer = io.BytesIO()
+                image.save(buffer, format="TIFF")
+                samples.append((key, buffer.getvalue(), text))
+                continue
+
+            file_base_name = f"{output_dir}/{key}"
 
             # Save TIF
-            image.save(f"{output_dir}/{ts}.tif")
+            image.save(f"{file_base_name}.tif")
 
             # Save TXT
-            with open(f"{output_dir}/{ts}.gt.txt", "w", encoding='utf-8') as text_file:
+            with open(f"{file_base_name}.gt.txt", "w", encoding='utf-8') as text_file:
                 text_file.write(text)
 
-            print(f"Saved image for word: {text}")
+    return first_index + len(contents), entries, samples
 
-            chunk_count += 1
-            print(f"chunk size: {chunk_count}")
+def open_shard_writer(shard_dir, name, start):
+    # line_shards.py lives in the tesstrain directory above.
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import line_shards
 
-            if chunk_count > chunk_size:
-                return
-        
-        print(f"Total chunk size: {chunk_count}")
+    return line_shards.ShardWriter(shard_dir, prefix=name, max_samples=None, start=start)
+
+def generate_images_from_huggingface(dataset_repo, chunk_size, fonts, output_dir,
+                                     local_dir=None, batch_size=64, jobs=None, restart=False,
+                                     shard_dir=None, shard_size=10000):
+    """
+    Render images for the records of a dataset repo in a pool of workers.
+
+    Records are read lazily in batches, either from the Parquet files below
+    local_dir/dataset_repo or from the HuggingFace Arrow cache. After every
+    finished batch the record offset is saved, so an interrupted generation
+    continues after the last finished batch. The chunk_size limit is checked
+    per batch; batches which are still running when it is reached are
+    finished and recorded as well.
+
+    With shard_dir, the images and texts are packed into shards of about
+    shard_size lines (see line_shards.py) instead of two files per line.
+    Shards are only finished after a whole batch, and the offset is saved
+    when a shard is finished, so a resumed generation rewrites the
+    unfinished shard.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    offsets = read_offsets(output_dir)
+    if restart:
+        # Only this repo starts over, the others sharing output_dir keep their offsets.
+        offsets.pop(dataset_repo, None)
+    state = offsets.setdefault(dataset_repo, {"offset": 0, "chunks": 0})
+    state.setdefault("shard", 0)
+    if state["chunks"] > chunk_size:
+        print(f"{dataset_repo}: already done ({state['chunks']} chunks)")
+        return
+    if state["offset"]:
+        print(f"{dataset_repo}: resuming at record {state['offset']} ({state['chunks']} chunks)")
+
+    if local_dir:
+        batches = iter_parquet_contents(os.path.join(local_dir, dataset_repo), state["offset"], batch_size)
+    else:
+        batches = iter_dataset_contents(dataset_repo, state["offset"], batch_size)
+
+    jobs = jobs or os.cpu_count() or 1
+    writer = open_shard_writer(shard_dir, source_name(dataset_repo), state["shard"]) if shard_dir else None
+    manifest = ManifestWriter(output_dir)
+    # Progress which is only saved together with the next finished shard.
+    shard_offset, shard_chunks, shard_entries = state["offset"], state["chunks"], []
+
+    print("Generate images...")
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(fonts,)) as pool:
+        # Only a few batches are in flight, so memory does not grow with the
+        # size of the repo, and the results are handled in record order.
+        pending = collections.deque()
+        batches = iter(batches)
+        done = False
+        while True:
+            while not done and len(pending) < 2 * jobs:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                first_index, contents = batch
+                target = None if writer is not None else output_dir
+                pending.append(pool.apply_async(render_contents, ((dataset_repo, first_index, contents, target),)))
+            if not pending:
+                break
+
+            next_offset, entries, samples = pending.popleft().get()
+            shard_offset = next_offset
+            shard_chunks += len(entries)
+            shard_entries.extend(entries)
+            done = done or shard_chunks > chunk_size
+            if writer is not None:
+                for (key, image, text), entry in zip(samples, entries):
+                    writer.add(key, image, ".tif", text, metadata=entry)
+                    entry["shard"] = os.path.basename(writer.path)
+                if len(writer) < shard_size and not (done and not pending):
+                    continue
+                writer.close()
+                state["shard"] = writer.next_shard
+            manifest.write(shard_entries)
+            shard_entries = []
+            state["offset"] = shard_offset
+            state["chunks"] = shard_chunks
+            save_offsets(output_dir, offsets)
+            print(f"{dataset_repo}: {next_offset} records, chunk size: {state['chunks']}")
+
+        # Leaving the context terminates the pool, all tasks are done by now.
+        pool.close()
+        pool.join()
+
+    if writer is not None and len(writer):
+        writer.close()
+        manifest.write(shard_entries)
+        state["offset"], state["chunks"], state["shard"] = shard_offset, shard_chunks, writer.next_shard
+        save_offsets(output_dir, offsets)
+    manifest.close()
+
+    print(f"Total chunk size: {state['chunks']}")
 
 def main():
-    output_dir = "../data/shn-ground-truth"
+    parser = argparse.ArgumentParser(description="Generate Shan line images from HuggingFace datasets")
+    parser.add_argument("--output-dir", default="../data/shn-ground-truth")
+    parser.add_argument("--local-dir", help="Read <local-dir>/<repo>/**/*.parquet instead of the HuggingFace cache")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Number of images for each repo (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Records per worker task (default: %(default)s)")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of worker processes (default: all CPUs)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved record offsets")
+    parser.add_argument("--shard-dir", help="Pack the lines into shards in this directory instead of single files")
+    parser.add_argument("--shard-size", type=int, default=10000, help="Lines per shard (default: %(default)s)")
+    args = parser.parse_args()
+
     fonts = [
         "fonts/Shan.ttf",
         "fonts/PangLong.ttf",
@@ -210,10 +340,11 @@ def main():
         "NorHsangPha/shan-news-ssppssa_org",
     ]
 
-    chunk_size = 50000 # for each repo
-
     for repo in huggingface_datasets_repo:
-        generate_images_from_huggingface(dataset_repo=repo, chunk_size=chunk_size, fonts=fonts, output_dir=output_dir)
+        generate_images_from_huggingface(dataset_repo=repo, chunk_size=args.chunk_size, fonts=fonts,
+                                         output_dir=args.output_dir, local_dir=args.local_dir,
+                                         batch_size=args.batch_size, jobs=args.jobs, restart=args.restart,
+                                         shard_dir=args.shard_dir, shard_size=args.shard_size)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,89 @@
+"""
+Sample IDs and manifests of generated line images.
+
+Sample IDs are derived from the origin of a line (source, record offset and
+chunk index within the record) instead of the time it was rendered, so
+worker processes can name their files without any coordination and a rerun
+of the same records overwrites its earlier output instead of duplicating it.
+
+Every generator run appends one JSON object per sample to manifest.jsonl in
+the output directory:
+
+    {"id": ..., "source": ..., "record": ..., "chunk": ..., "font": ...,
+     "font_size": ..., "width": ..., "height": ..., "text_hash": ...}
+
+Later stages can join on the IDs instead of globbing the output directory.
+Records of an interrupted batch are rendered and appended again when the
+generation is resumed, so read_manifest() keeps the last entry of an ID.
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_FILE = "manifest.jsonl"
+
+
+def source_name(source):
+    """File name safe form of a source, e.g. a HuggingFace repo."""
+    return source.replace("/", "__")
+
+
+def sample_id(source, record, chunk=0):
+    return f"{source_name(source)}_{record}_{chunk}"
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def manifest_entry(source, record, chunk, text, font, font_size=None, size=None):
+    """Return the manifest entry of a sample, size is (width, height) if known."""
+    return {
+        "id": sample_id(source, record, chunk),
+        "source": source,
+        "record": record,
+        "chunk": chunk,
+        "font": os.path.basename(font),
+        "font_size": font_size,
+        "width": size[0] if size else None,
+        "height": size[1] if size else None,
+        "text_hash": text_hash(text),
+    }
+
+
+class ManifestWriter:
+    """Append manifest entries, written by the parent process only."""
+
+    def __init__(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, MANIFEST_FILE)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def write(self, entries):
+        for entry in entries:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        # Flushed before the offsets are saved, so no finished batch is missing.
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_manifest(path):
+    """Return a dictionary from sample ID to the last manifest entry of the ID."""
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST_FILE)
+    entries = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entries[entry["id"]] = entry
+    return entries
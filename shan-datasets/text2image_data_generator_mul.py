@@ -1,10 +1,16 @@
 import re
 import os
 import random
+import argparse
 import pathlib
+import tempfile
 import subprocess
 import multiprocessing
+from PIL import Image
 from shannlp import word_tokenize, shan_characters, shan_digits
+from sample_ids import ManifestWriter, manifest_entry, sample_id
+from fontconfig_cache import prepare_fontconfig_cache
+from font_coverage import FontCoverage, FontScheduler
 
 # Precompile regex for better performance
 EMOJI_PATTERN = re.compile("["
@@ -33,8 +39,14 @@ DUPLICATE_MARK_PATTERN = re.compile(r"ႉ{2,}")
 
 ALLOWED_CHARS = set(shan_characters + shan_digits + "/-'\"")
 
+# Page size for batches, small enough that every page holds a single text line.
+BATCH_XSIZE = 3600
+BATCH_YSIZE = 200
+BATCH_MARGIN = 40
+# Padding around the text when a page is cropped to a line image.
+CROP_PADDING = 10
+
 FONTS = ["GreatHorKham Taunggyi", "Myanmar Text", "PangLong Italic", "Pyidaungsu", "Shan"]
-NUM_FONTS = len(FONTS)
 
 def remove_emojis(text):
     return EMOJI_PATTERN.sub('', text)
@@ -55,27 +67,41 @@ def clean_shan_text(text, keep_numbers=True):
     text = remove_myanmar_text(text)
     return text if keep_numbers else re.sub(rf'[^{shan_characters}\s]', '', text)
 
-def get_font_name(index, total_count):
-    return FONTS[(index * NUM_FONTS) // total_count]
+def schedule_lines(pool, lines, coverage):
+    """
+    Clean the (line number, line) pairs in the pool and assign the remaining
+    ones to fonts in order. Returns a list of (line number, cleaned line,
+    font) tuples.
+    """
+    scheduler = FontScheduler(FONTS, coverage)
+    scheduled = []
+    skipped = 0
+    cleaned_lines = pool.imap(clean_shan_text, (line for _, line in lines), chunksize=256)
+    for (line_count, _), cleaned_line in zip(lines, cleaned_lines):
+        # Skip short sentences and lines without a font having all glyphs.
+        font_name = scheduler.assign(cleaned_line) if len(cleaned_line) >= 20 else None
+        if font_name is None:
+            skipped += 1
+            continue
+        scheduled.append((line_count, cleaned_line, font_name))
+    print(f"{skipped} lines skipped; {scheduler.summary()}")
+    return scheduled
 
 def process_line(args):
-    line, line_count, output_directory, fonts_dir, training_text_file_name, total_count = args
-    
-    cleaned_line = clean_shan_text(line)
-    if len(cleaned_line) < 20:
-        return  # Skip short sentences
+    """Render a single line, returns its manifest entry or None if text2image failed."""
+    cleaned_line, line_count, font_name, output_directory, fonts_dir, training_text_file_name, fontconfig_dir = args
     
-    font_name = get_font_name(line_count, total_count)
-    file_base_name = f'{training_text_file_name}_{line_count}'
+    file_base_name = sample_id(training_text_file_name, line_count)
     line_file = os.path.join(output_directory, f'{file_base_name}.gt.txt')
     
     with open(line_file, 'w') as f:
         f.write(cleaned_line)
     
-    subprocess.run([
+    result = subprocess.run([
         'text2image',
         f'--font={font_name}',
         f'--fonts_dir={fonts_dir}',
+        f'--fontconfig_tmpdir={fontconfig_dir}',
         f'--text={line_file}',
         f'--outputbase={output_directory}/{file_base_name}',
         '--max_pages=1',
@@ -87,28 +113,183 @@ def process_line(args):
         '--exposure=0',
         '--unicharset_file=data/shn/unicharset'
     ])
+    tif_file = os.path.join(output_directory, f'{file_base_name}.tif')
+    if result.returncode != 0 or not os.path.exists(tif_file):
+        print(f"{font_name}: text2image failed for line {line_count} with exit code {result.returncode}")
+        # No ground truth without an image.
+        os.remove(line_file)
+        return None
+    with Image.open(tif_file) as image:
+        size = image.size
+    return manifest_entry(training_text_file_name, line_count, 0, cleaned_line, font_name, size=size)
+
+def read_page_boxes(box_file):
+    """Return (page, [(char, left, bottom, right, top), ...]) for the pages of a text2image box file."""
+    pages = {}
+    with open(box_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            char, left, bottom, right, top, page = line.rsplit(' ', 5)
+            pages.setdefault(int(page), []).append((char, int(left), int(bottom), int(right), int(top)))
+    return sorted(pages.items())
+
+def page_text(boxes):
+    # Tab boxes mark the end of the text line.
+    return MULTI_SPACE_PATTERN.sub(' ', ''.join(char for char, *_ in boxes if char != '\t')).strip()
+
+def assign_pages(lines, texts):
+    """
+    Map the page texts of a batch to (index of the input line, chunk) pairs,
+    or None for pages which match no line.
+
+    Lines which are too long for one page are continued on the next pages, and
+    --strip_unrenderable_words may drop words or whole lines, so the pages are
+    matched by their text: a page belongs to the current line while its text
+    is found in the not yet rendered rest of the line, otherwise to the next
+    line which contains it.
+    """
+    def squeeze(text):
+        return MULTI_SPACE_PATTERN.sub('', text)
+
+    assigned = []
+    current, chunk, rest = 0, 0, squeeze(lines[0]) if lines else ''
+    for text in texts:
+        text = squeeze(text)
+        index, candidate = current, rest
+        # Skip lines without (further) pages.
+        while text and text not in candidate and index + 1 < len(lines):
+            index += 1
+            candidate = squeeze(lines[index])
+        if not text or text not in candidate:
+            assigned.append(None)
+            continue
+        if index != current:
+            current, chunk = index, 0
+        rest = candidate[candidate.index(text) + len(text):]
+        assigned.append((current, chunk))
+        chunk += 1
+    return assigned
 
-def text2img_data_generator(training_text_file, output_directory, fonts_dir, count):
+def render_batch(args):
+    """
+    Render a batch of lines with the same font in a single text2image call and
+    split the multipage result into one cropped line image per page. The
+    ground truth of a page is taken from its boxes, so it matches what was
+    actually rendered. The lines are already cleaned. Returns the manifest
+    entries of the samples.
+    """
+    font_name, items, output_directory, fonts_dir, training_text_file_name, fontconfig_dir = args
+
+    entries = []
+    with tempfile.TemporaryDirectory() as tmp:
+        text_file = os.path.join(tmp, 'batch.txt')
+        with open(text_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(line for _, line in items) + '\n')
+        outputbase = os.path.join(tmp, 'batch')
+        try:
+            subprocess.run([
+                'text2image',
+                f'--font={font_name}',
+                f'--fonts_dir={fonts_dir}',
+                f'--fontconfig_tmpdir={fontconfig_dir}',
+                f'--text={text_file}',
+                f'--outputbase={outputbase}',
+                '--max_pages=0',
+                '--strip_unrenderable_words',
+                '--leading=32',
+                f'--xsize={BATCH_XSIZE}',
+                f'--ysize={BATCH_YSIZE}',
+                f'--margin={BATCH_MARGIN}',
+                '--char_spacing=1.0',
+                '--exposure=0',
+                '--unicharset_file=data/shn/unicharset'
+            ], check=True)
+        except subprocess.CalledProcessError as e:
+            # Only this batch is lost, not the whole run.
+            print(f"{font_name}: text2image failed for lines {items[0][0]}..{items[-1][0]} with exit code {e.returncode}")
+            return entries
+
+        pages = read_page_boxes(outputbase + '.box')
+        texts = [page_text(boxes) for _, boxes in pages]
+        assigned = assign_pages([line for _, line in items], texts)
+        with Image.open(outputbase + '.tif') as tif:
+            for (page, boxes), text, assignment in zip(pages, texts, assigned):
+                if assignment is None:
+                    continue
+                index, chunk = assignment
+                tif.seek(page)
+                height = tif.height
+                # Box coordinates start at the bottom left corner.
+                crop = (max(0, min(box[1] for box in boxes) - CROP_PADDING),
+                        max(0, height - max(box[4] for box in boxes) - CROP_PADDING),
+                        min(tif.width, max(box[3] for box in boxes) + CROP_PADDING),
+                        min(height, height - min(box[2] for box in boxes) + CROP_PADDING))
+                image = tif.crop(crop)
+
+                line_count = items[index][0]
+                entry = manifest_entry(training_text_file_name, line_count, chunk, text, font_name,
+                                       size=image.size)
+                file_base_name = os.path.join(output_directory, entry['id'])
+                image.save(f'{file_base_name}.tif')
+                with open(f'{file_base_name}.gt.txt', 'w', encoding='utf-8') as f:
+                    f.write(text)
+                entries.append(entry)
+    return entries
+
+def text2img_data_generator(training_text_file, output_directory, fonts_dir, count, batch_size=0):
     os.makedirs(output_directory, exist_ok=True)
     
+    # Lines keep their number in the file, which becomes the record of their
+    # sample IDs, so the manifest can be joined with the text file.
     with open(training_text_file, 'r') as file:
-        lines = [line.strip() for line in file if len(line.strip()) >= 20]
+        lines = [(n, line.strip()) for n, line in enumerate(file) if len(line.strip()) >= 20]
     
     random.shuffle(lines)
     lines = lines[:count]
     
     training_text_file_name = pathlib.Path(training_text_file).stem
+    fontconfig_dir = prepare_fontconfig_cache(fonts_dir, FONTS[0])
+    coverage = FontCoverage.load(fonts_dir)
     
-    with multiprocessing.Pool() as pool:
-        pool.map(process_line, [(line, i, output_directory, fonts_dir, training_text_file_name, count)
-                                for i, line in enumerate(lines)])
+    with multiprocessing.Pool() as pool, ManifestWriter(output_directory) as manifest:
+        scheduled = schedule_lines(pool, lines, coverage)
+
+        if batch_size:
+            # One text2image call per batch of lines with the same font
+            # instead of one per line.
+            by_font = {}
+            for line_count, cleaned_line, font_name in scheduled:
+                by_font.setdefault(font_name, []).append((line_count, cleaned_line))
+            tasks = [(font_name, items[start:start + batch_size], output_directory, fonts_dir, training_text_file_name,
+                      fontconfig_dir)
+                     for font_name, items in by_font.items()
+                     for start in range(0, len(items), batch_size)]
+            for entries in pool.imap_unordered(render_batch, tasks):
+                manifest.write(entries)
+            return
+
+        tasks = [(cleaned_line, line_count, font_name, output_directory, fonts_dir, training_text_file_name,
+                  fontconfig_dir)
+                 for line_count, cleaned_line, font_name in scheduled]
+        # Workers name their files by sample ID, only the manifest is written here.
+        for entry in pool.imap(process_line, tasks, chunksize=64):
+            if entry is not None:
+                manifest.write([entry])
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate Shan line images with text2image")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="Lines per text2image call, 0 for one call per line (default: %(default)s)")
+    args = parser.parse_args()
+
     text2img_data_generator(
         training_text_file='./shannews.txt',
         output_directory="../data/shn-ground-truth",
         fonts_dir='/home/noernova/Labs/tesstrain/shan-datasets/fonts',
-        count=300000
+        count=300000,
+        batch_size=args.batch_size
     )
 
 if __name__ == "__main__":
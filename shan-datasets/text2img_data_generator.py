@@ -1,126 +1,63 @@
-import re
-from shannlp import word_tokenize, shan_characters, shan_digits
+from corpus_cleaner import ShanTextCleaner, TEXT2IMG_EXTRA_CHARS
+from fontconfig_cache import prepare_fontconfig_cache
+from font_coverage import FontCoverage, FontScheduler
+from sample_ids import ManifestWriter, manifest_entry, sample_id
+from PIL import Image
 import os
 import random
 import pathlib
 import subprocess
 
-def remove_emojis(data):
-    emoj = re.compile("["
-        u"\U0001F600-\U0001F64F"  # emoticons
-        u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-        u"\U0001F680-\U0001F6FF"  # transport & map symbols
-        u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-        u"\U00002500-\U00002BEF"  # chinese char
-        u"\U00002702-\U000027B0"
-        u"\U000024C2-\U0001F251"
-        u"\U0001f926-\U0001f937"
-        u"\U00010000-\U0010ffff"
-        u"\u2640-\u2642" 
-        u"\u2600-\u2B55"
-        u"\u200d"
-        u"\u23cf"
-        u"\u23e9"
-        u"\u231a"
-        u"\ufe0f"  # dingbats
-        u"\u3030"
-        "]+", re.UNICODE)
-    return re.sub(emoj, '', data)
-
-def remove_latin_text(text):
-    text = re.sub(r"[^\u1000-\u109f0-9\s/\-\"']", '', text)
-    text = re.sub(r"\s+", " ", text)
-    return text
-
-def remove_myanmar_text(text):
-    allowed_chars = set(shan_characters + shan_digits + "/-'\"")
-    tokens = word_tokenize(text, engine="newmm")
-    cleaned_words = []
-
-    for word in tokens:
-        is_shan_word = True
-        for char in word:
-            if char not in allowed_chars and not char.isspace() and not char.isnumeric():
-                is_shan_word = False
-                break
-        if is_shan_word:
-            cleaned_words.append(word)
-    
-    cleaned_text = "".join(cleaned_words)
-    
-    cleaned_text = re.sub(r'\s+', ' ', cleaned_text).strip()
-    
-    return cleaned_text
+CLEANER = ShanTextCleaner(keep_numbers=True, extra_chars=TEXT2IMG_EXTRA_CHARS, normalize=False)
+CLEANER_NO_NUMBERS = ShanTextCleaner(keep_numbers=False, extra_chars=TEXT2IMG_EXTRA_CHARS, normalize=False)
 
 def clean_shan_text(text, keep_numbers=True):
-    
-    text = remove_emojis(text)
-
-    text = text.replace("၊", "၊ ").replace("။", "။ ").replace(" ၊", "၊ ").replace(" ။", "။ ").strip()
-    text = re.sub(r"ႉ{2,}", "ႉ", text)
-    text = text.replace("ႆၢ", "ၢႆ")
-    text = text.replace("ေတ", "တေ")
-
-    text = remove_latin_text(text)
-    text = remove_myanmar_text(text)
-    
-    # Latin Numbers
-    numbers = r"0-9" if keep_numbers else ""
-    text = re.sub(rf'[^{numbers}{shan_characters}\s]', '', text)
-    
-    return text
-
-def get_font_name(line_count, total_count):
-    fonts = ["GreatHorKham Taunggyi", "Myanmar Text", "PangLong Italic", "Pyidaungsu", "Shan"]
-    num_fonts = len(fonts)
-    
-    range_size = total_count // num_fonts
-    
-    font_ranges = [(i * range_size, (i + 1) * range_size, fonts[i]) for i in range(num_fonts)]
-    
-    for min_val, max_val, font in font_ranges:
-        if min_val <= line_count < max_val:
-            return font
-    
-    return "Shan"  # Default
+    return (CLEANER if keep_numbers else CLEANER_NO_NUMBERS).clean(text)
+
+FONTS = ["GreatHorKham Taunggyi", "Myanmar Text", "PangLong Italic", "Pyidaungsu", "Shan"]
 
 def text2img_data_generator(training_text_file: str, output_directory: str, fonts_dir: str, count: int):
 
     lines = []
 
+    # Lines keep their number in the file as the record of their sample IDs.
     with open(training_text_file, 'r') as input_file:
-        for line in input_file.readlines():
-            lines.append(line.strip())
+        for n, line in enumerate(input_file.readlines()):
+            lines.append((n, line.strip()))
 
     if not os.path.exists(output_directory):
         os.mkdir(output_directory)
 
     random.shuffle(lines)
+    fontconfig_dir = prepare_fontconfig_cache(fonts_dir, "Shan")
+    # Balances the rendered characters per font over the lines which are kept.
+    scheduler = FontScheduler(FONTS, FontCoverage.load(fonts_dir))
 
-    line_count = 0
     lines = lines[:count]
+    training_text_file_name = pathlib.Path(training_text_file).stem
+    manifest = ManifestWriter(output_directory)
 
-    for line in lines:
-        line = line.strip()
+    for line_count, line in lines:
         line = clean_shan_text(line)
 
         # remove short sentences
         if len(line) < 20:
             continue
 
-        fonts_name = get_font_name(line_count, total_count=count)
+        fonts_name = scheduler.assign(line)
+        if fonts_name is None:
+            continue
 
-        training_text_file_name = pathlib.Path(training_text_file).stem
-        line_training_text = os.path.join(output_directory, f'{training_text_file_name}_{line_count}.gt.txt')
+        file_base_name = sample_id(training_text_file_name, line_count)
+        line_training_text = os.path.join(output_directory, f'{file_base_name}.gt.txt')
         with open(line_training_text, 'w') as output_file:
             output_file.writelines([line])
 
-        file_base_name = f'{training_text_file_name}_{line_count}'
-
-        subprocess.run([
+        result = subprocess.run([
             'text2image',
             f'--font={fonts_name}',
             f'--fonts_dir={fonts_dir}',
+            f'--fontconfig_tmpdir={fontconfig_dir}',
             f'--text={line_training_text}',
             f'--outputbase={output_directory}/{file_base_name}',
             '--max_pages=1',
@@ -133,7 +70,15 @@ def text2img_data_generator(training_text_file: str, output_directory: str, font
             '--unicharset_file=data/shn/unicharset'
         ])
 
-        line_count += 1
+        tif_file = os.path.join(output_directory, f'{file_base_name}.tif')
+        if result.returncode != 0 or not os.path.exists(tif_file):
+            print(f"{fonts_name}: text2image failed for line {line_count} with exit code {result.returncode}")
+            os.remove(line_training_text)
+            continue
+        with Image.open(tif_file) as image:
+            manifest.write([manifest_entry(training_text_file_name, line_count, 0, line, fonts_name, size=image.size)])
+
+    manifest.close()
 
 def main():
     training_text_file = './shannews.txt'
@@ -21,8 +21,9 @@ import os
 import pathlib
 import platform
 from datetime import date
-from tempfile import TemporaryDirectory, mkdtemp
+from tempfile import mkdtemp
 
+from tesstrain.cache import default_cache_dir, fontconfig_cache_dir
 from tesstrain.generate import err_exit
 
 log = logging.getLogger(__name__)
@@ -35,8 +36,7 @@ class TrainingArguments(argparse.Namespace):
         self.lang_code = 'eng'
         self.timestamp = str(date.today())
 
-        self._font_config_cache = TemporaryDirectory(prefix='font_tmp')
-        self.font_config_cache = self._font_config_cache.name
+        self.font_config_cache = None
         self.fonts_dir = (
             '/Library/Fonts/'
             if 'darwin' in self.uname
@@ -50,6 +50,11 @@ class TrainingArguments(argparse.Namespace):
         self.run_shape_clustering = False
         self.extract_font_properties = True
         self.distort_image = False
+        self.jobs = 0
+        self.cache_dir = None
+        self.render_cache_size = 10240
+        self.work_dir = None
+        self.resume_dir = None
 
     def __eq__(self, other):
         return (
@@ -66,6 +71,11 @@ class TrainingArguments(argparse.Namespace):
             and self.run_shape_clustering == other.run_shape_clustering
             and self.extract_font_properties == other.extract_font_properties
             and self.distort_image == other.distort_image
+            and self.jobs == other.jobs
+            and self.cache_dir == other.cache_dir
+            and self.render_cache_size == other.render_cache_size
+            and self.work_dir == other.work_dir
+            and self.resume_dir == other.resume_dir
         )
 
 
@@ -97,6 +107,20 @@ def get_argument_parser():
     parser.add_argument(
         '--tmp_dir', help='Path to temporary training directory.'
     )
+    parser.add_argument(
+        '--work_dir',
+        metavar='WORKDIR',
+        help=(
+            'Path to a persistent training directory which is kept after the run. '
+            'Rerunning with the same directory skips all work whose inputs are unchanged.'
+        ),
+    )
+    parser.add_argument(
+        '--resume',
+        metavar='WORKDIR',
+        dest='resume_dir',
+        help='Resume an interrupted run in an existing --work_dir.',
+    )
     parser.add_argument(
         '--lang', metavar='LANG_CODE', dest='lang_code', help='ISO 639 code.'
     )
@@ -184,6 +208,30 @@ def get_argument_parser():
         help='Size of printed text.',
     )
 
+    parser.add_argument(
+        '--jobs',
+        metavar='JOBS',
+        type=int,
+        help='Number of parallel tesseract processes for feature extraction (default: number of CPUs).',
+    )
+
+    cache_group = parser.add_argument_group(
+        'cache',
+        'OPTIONAL flags for the persistent cache which is shared between runs.',
+    )
+    cache_group.add_argument(
+        '--cache_dir',
+        metavar='CACHEDIR',
+        help='Path to cache directory (default: $XDG_CACHE_HOME/tesstrain). '
+        'Partial unicharsets and .train_ngrams texts are kept up to 64 MB each.',
+    )
+    cache_group.add_argument(
+        '--render_cache_size',
+        metavar='MEGABYTES',
+        type=int,
+        help='Maximum size of the cache for rendered images, 0 disables it (default: 10240).',
+    )
+
     return parser
 
 
@@ -203,6 +251,13 @@ def verify_parameters_and_handle_defaults(ctx):
             )
         else:
             ctx.tessdata_dir = tessdata_prefix
+    if not ctx.jobs or ctx.jobs < 1:
+        ctx.jobs = os.cpu_count() or 1
+    if not ctx.cache_dir:
+        ctx.cache_dir = default_cache_dir()
+    if not ctx.font_config_cache:
+        # Shared by all runs (and the shan-datasets generators) with the same fonts.
+        ctx.font_config_cache = str(fontconfig_cache_dir(ctx.cache_dir, ctx.fonts_dir))
     if not ctx.output_dir:
         ctx.output_dir = mkdtemp(
             prefix=f'trained-{ctx.lang_code}-{ctx.timestamp}'
@@ -210,7 +265,15 @@ def verify_parameters_and_handle_defaults(ctx):
         log.info(f'Output directory set to: {ctx.output_dir}')
 
     # Location where intermediate files will be created.
-    if not ctx.tmp_dir:
+    if ctx.resume_dir:
+        if not pathlib.Path(ctx.resume_dir).is_dir():
+            err_exit(f'Cannot resume: {ctx.resume_dir} does not exist')
+        ctx.work_dir = ctx.resume_dir
+    if ctx.work_dir:
+        ctx.work_dir = pathlib.Path(ctx.work_dir).resolve()
+        ctx.work_dir.mkdir(parents=True, exist_ok=True)
+        ctx.training_dir = str(ctx.work_dir)
+    elif not ctx.tmp_dir:
         ctx.training_dir = mkdtemp(prefix=f'{ctx.lang_code}-{ctx.timestamp}')
     else:
         ctx.training_dir = mkdtemp(
@@ -226,7 +289,9 @@ def verify_parameters_and_handle_defaults(ctx):
         if pathlib.Path(training_dir).exists():
             print(f'Temporary files retained at: {training_dir}')
 
-    atexit.register(show_tmpdir_location, ctx.training_dir)
+    # A work directory is kept on purpose, also after a successful run.
+    if not ctx.work_dir:
+        atexit.register(show_tmpdir_location, ctx.training_dir)
 
     # Take training text and wordlist from the langdata directory if not
     # specified in the command-line.
@@ -0,0 +1,214 @@
+# (C) Copyright 2014, Google Inc.
+# (C) Copyright 2018, James R Barlow
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Persistent caches shared by tesstrain runs.
+"""
+
+import hashlib
+import logging
+import os
+import pathlib
+import shutil
+import threading
+
+log = logging.getLogger(__name__)
+
+_digest_lock = threading.Lock()
+_digests = {}
+
+
+def default_cache_dir():
+    """
+    Return the default cache directory, following the XDG base directory spec.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache'
+    return pathlib.Path(base) / 'tesstrain'
+
+
+def file_digest(filename):
+    """
+    Return the SHA-256 hex digest of a file's contents.
+
+    Digests are memoized per (path, mtime, size) for the lifetime of the process.
+    """
+    path = pathlib.Path(filename).resolve()
+    st = path.stat()
+    memo_key = (str(path), st.st_mtime_ns, st.st_size)
+    with _digest_lock:
+        if memo_key in _digests:
+            return _digests[memo_key]
+    h = hashlib.sha256()
+    with path.open('rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    digest = h.hexdigest()
+    with _digest_lock:
+        _digests[memo_key] = digest
+    return digest
+
+
+def listing_digest(directory):
+    """
+    Return a digest of the names, sizes and modification times of all files
+    below a directory.
+    """
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(directory, followlinks=True):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            rel = os.path.relpath(path, directory)
+            h.update(f'{rel}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode())
+    return h.hexdigest()
+
+
+FONTCONFIG_READY = '.ready'
+
+
+def fontconfig_cache_dir(cache_dir, fonts_dir):
+    """
+    Return the persistent fontconfig cache directory for fonts_dir.
+
+    The directory is named after a digest of the fonts_dir listing, so runs
+    with unchanged fonts share it, and a changed font directory gets a new
+    one which is scanned again.
+    """
+    path = pathlib.Path(cache_dir) / 'fontconfig' / listing_digest(fonts_dir)[:16]
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def is_fontconfig_cache_ready(path):
+    """Return True if the fontconfig cache directory was already warmed up."""
+    return (pathlib.Path(path) / FONTCONFIG_READY).exists()
+
+
+def mark_fontconfig_cache_ready(path):
+    (pathlib.Path(path) / FONTCONFIG_READY).touch()
+
+
+# Size limit of each cache of small derived files (partial unicharsets and
+# .train_ngrams texts), which are evicted like the render cache.
+DERIVED_CACHE_SIZE = 64 * 1024 * 1024
+
+
+def evict_lru(root, max_size):
+    """
+    Remove the least recently used entries (files or directories) below root
+    until their total size fits max_size. Entries starting with `.tmp-` are
+    still being written and left alone. Users of an entry record its use by
+    updating its modification time.
+    """
+    entries = []
+    total = 0
+    for entry in pathlib.Path(root).iterdir():
+        if entry.name.startswith('.tmp-'):
+            continue
+        try:
+            if entry.is_dir():
+                size = sum(f.stat().st_size for f in entry.iterdir())
+            else:
+                size = entry.stat().st_size
+            entries.append((entry.stat().st_mtime, size, entry))
+        except OSError:
+            # Removed by a concurrent run.
+            continue
+        total += size
+    entries.sort()
+    for _, size, entry in entries:
+        if total <= max_size:
+            break
+        log.debug(f'Evicting {entry.name} from {root}')
+        if entry.is_dir():
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            try:
+                entry.unlink()
+            except OSError:
+                pass
+        total -= size
+
+
+def make_key(*parts):
+    """Return a hex digest for a sequence of strings."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """Hard link src to dst, or copy it if linking fails."""
+    dst = pathlib.Path(dst)
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class RenderCache:
+    """
+    Content-addressed cache for the files rendered by text2image.
+
+    Each entry is a directory named after the key, holding the outputs of one
+    text2image run with the suffixes as file names (e.g. `.tif`, `.box`). The
+    total size of the cache is limited by evicting the least recently used
+    entries.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.root = pathlib.Path(cache_dir) / 'render'
+        self.max_size = max_size
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def fetch(self, key, outbase, suffixes):
+        """
+        Link (or copy) the cached files for key to outbase + suffix. Returns
+        False if there is no complete entry for key.
+        """
+        entry = self.root / key
+        if not all((entry / suffix).exists() for suffix in suffixes):
+            return False
+        for suffix in suffixes:
+            link_or_copy(entry / suffix, f'{outbase}{suffix}')
+        # The modification time of the entry records its last use.
+        os.utime(entry)
+        return True
+
+    def store(self, key, outbase, suffixes):
+        """Add the files outbase + suffix to the cache under key."""
+        entry = self.root / key
+        if entry.exists():
+            return
+        tmp = self.root / f'.tmp-{key}-{os.getpid()}-{threading.get_ident()}'
+        try:
+            tmp.mkdir()
+            for suffix in suffixes:
+                link_or_copy(f'{outbase}{suffix}', tmp / suffix)
+            tmp.rename(entry)
+        except OSError as e:
+            log.warning(f'Could not add {outbase} to render cache: {e}')
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp, ignore_errors=True)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_size."""
+        evict_lru(self.root, self.max_size)
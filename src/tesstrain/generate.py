@@ -17,18 +17,37 @@ For a detailed description of the phases, see
 https://tesseract-ocr.github.io/tessdoc/Training-Tesseract.html.
 """
 
+import collections
 import concurrent.futures
+import functools
 import logging
 import os
 import pathlib
+import re
 import shutil
+import struct
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 from operator import itemgetter
 
 from tqdm import tqdm
 
+from tesstrain.cache import (
+    DERIVED_CACHE_SIZE,
+    RenderCache,
+    evict_lru,
+    file_digest,
+    is_fontconfig_cache_ready,
+    listing_digest,
+    make_key,
+    mark_fontconfig_cache_ready,
+)
 from tesstrain.language_specific import VERTICAL_FONTS
+from tesstrain.manifest import open_manifest
+from tesstrain.ngrams import make_train_ngrams
 
 log = logging.getLogger(__name__)
 
@@ -38,10 +57,67 @@ def err_exit(msg):
     sys.exit(1)
 
 
+# Part of ARG_MAX left for the auxiliary vector and alignment, like xargs does.
+ARG_MAX_HEADROOM = 2048
+
+# Lines of output of a failed command which are logged as errors.
+FAILED_OUTPUT_LINES = 200
+
+
+def arg_max():
+    """
+    Return the number of bytes available for the arguments and environment of
+    a new process.
+    """
+    try:
+        limit = os.sysconf('SC_ARG_MAX')
+    except (AttributeError, ValueError, OSError):
+        limit = -1
+    if limit <= 0:
+        # Windows limits the command line to 32767 characters.
+        limit = 32767
+    return limit - ARG_MAX_HEADROOM
+
+
+def command_size(args, env=None):
+    """
+    Return the number of bytes which exec() needs for args and env (the current
+    environment if None): the strings with their terminators and pointers.
+    """
+    if env is None:
+        env = os.environ
+    strings = [*(str(arg) for arg in args), *(f'{k}={v}' for k, v in env.items())]
+    pointer = struct.calcsize('P')
+    return sum(len(os.fsencode(string)) + 1 + pointer for string in strings)
+
+
+def split_args(args, items, env=None):
+    """
+    Split items into chunks which fit on a command line after args, like xargs.
+    """
+    limit = arg_max()
+    base = command_size(args, env)
+    chunk = []
+    size = base
+    for item in items:
+        item_size = command_size([item], {})
+        if chunk and size + item_size > limit:
+            yield chunk
+            chunk = []
+            size = base
+        chunk.append(item)
+        size += item_size
+    if chunk:
+        yield chunk
+
+
 def run_command(cmd, *args, env=None):
     """
     Helper function to run a command and append its output to a log. Aborts early if
-    the program file is not found.
+    the program file is not found, or if the command line is too long (use
+    `split_args` for long lists of files).
+
+    The output is logged line by line while the command runs.
     """
     for d in ('', 'api/', 'training/'):
         testcmd = shutil.which(f'{d}{cmd}')
@@ -60,17 +136,20 @@ def run_command(cmd, *args, env=None):
         if isinstance(arg, pathlib.WindowsPath):
             args[idx] = str(arg)
 
-    proc = subprocess.run(
-        [cmd, *args], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env
-    )
+    if command_size([cmd, *args], env) > arg_max():
+        err_exit(f'Command line of {cmd} with {len(args)} arguments is too long')
+
     proclog = logging.getLogger(cmd)
-    if proc.returncode == 0:
-        proclog.debug(proc.stdout.decode('utf-8', errors='replace'))
-    else:
-        try:
-            proclog.error(proc.stdout.decode('utf-8', errors='replace'))
-        except Exception as e:
-            proclog.error(e)
+    tail = collections.deque(maxlen=FAILED_OUTPUT_LINES)
+    with subprocess.Popen(
+        [cmd, *args], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env
+    ) as proc:
+        for line in proc.stdout:
+            line = line.decode('utf-8', errors='replace').rstrip('\r\n')
+            proclog.debug(line)
+            tail.append(line)
+    if proc.returncode != 0:
+        proclog.error('\n'.join(tail))
         err_exit(
             f'Program {cmd} failed with return code {proc.returncode}. Abort.'
         )
@@ -100,25 +179,36 @@ def check_file_readable(*filenames):
 def cleanup(ctx):
     if os.path.exists(ctx.log_file):
         shutil.copy(ctx.log_file, ctx.output_dir)
+    if ctx.work_dir:
+        log.info(f'Keeping work directory {ctx.training_dir} for later runs')
+        return
     shutil.rmtree(ctx.training_dir)
 
 
 def initialize_fontconfig(ctx):
     """
-    Initialize the font configuration with a unique font cache directory.
+    Initialize the font configuration cache directory, unless an earlier run
+    with the same fonts already did.
     """
-    sample_path = pathlib.Path(ctx.font_config_cache) / 'sample_text.txt'
-    pathlib.Path(sample_path).write_text('Text\n')
-    log.info(f'Testing font: {ctx.fonts[0]}')
-    run_command(
-        'text2image',
-        f'--fonts_dir={ctx.fonts_dir}',
-        f'--font={ctx.fonts[0]}',
-        f'--outputbase={sample_path}',
-        f'--text={sample_path}',
-        f'--fontconfig_tmpdir={ctx.font_config_cache}',
-        f'--ptsize={ctx.ptsize}',
-    )
+    if is_fontconfig_cache_ready(ctx.font_config_cache):
+        log.info(f'Using font cache {ctx.font_config_cache}')
+        return
+    # Rendered outside of training_dir, so that the sample box file does not
+    # end up in the unicharset.
+    with tempfile.TemporaryDirectory() as tmp:
+        sample_path = pathlib.Path(tmp) / 'sample_text.txt'
+        sample_path.write_text('Text\n')
+        log.info(f'Testing font: {ctx.fonts[0]}')
+        run_command(
+            'text2image',
+            f'--fonts_dir={ctx.fonts_dir}',
+            f'--font={ctx.fonts[0]}',
+            f'--outputbase={sample_path}',
+            f'--text={sample_path}',
+            f'--fontconfig_tmpdir={ctx.font_config_cache}',
+            f'--ptsize={ctx.ptsize}',
+        )
+    mark_fontconfig_cache_ready(ctx.font_config_cache)
 
 
 def make_fontname(font):
@@ -132,37 +222,155 @@ def make_outbase(ctx, fontname, exposure):
     )
 
 
-def generate_font_image(ctx, font, exposure, char_spacing):
+# Face names which Pango leaves out of a font description.
+REGULAR_STYLES = ('regular', 'normal', 'book', 'roman')
+
+
+@functools.lru_cache(maxsize=None)
+def scan_font_files(fonts_dir):
+    """
+    Map lowercase font descriptions (e.g. 'arial bold') to the font files in
+    fonts_dir, using fc-scan. Returns an empty dict if fc-scan is unavailable.
+    """
+    fc_scan = shutil.which('fc-scan')
+    if not fc_scan:
+        return {}
+    proc = subprocess.run(
+        [fc_scan, '--format', '%{family[0]}\t%{style[0]}\t%{file}\n', fonts_dir],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    font_files = {}
+    for line in proc.stdout.decode('utf-8', errors='replace').splitlines():
+        fields = line.split('\t')
+        if len(fields) != 3:
+            continue
+        family, style, filename = fields
+        font_files.setdefault(f'{family} {style}'.lower(), filename)
+        if style.lower() in REGULAR_STYLES:
+            font_files.setdefault(family.lower(), filename)
+    return font_files
+
+
+def font_digest(ctx, font):
+    """
+    Return a digest of the font file used for font.
+
+    Falls back to a digest of the whole fonts_dir listing if the font file
+    cannot be determined.
+    """
+    description = ' '.join(font.replace(',', ' ').split()).lower()
+    filename = scan_font_files(str(ctx.fonts_dir)).get(description)
+    if filename:
+        return file_digest(filename)
+    return 'dir:' + listing_digest(ctx.fonts_dir)
+
+
+@functools.lru_cache(maxsize=None)
+def text2image_version():
+    text2image = shutil.which('text2image') or 'text2image'
+    try:
+        proc = subprocess.run(
+            [text2image, '--version'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+    except OSError:
+        return ''
+    return proc.stdout.decode('utf-8', errors='replace').strip()
+
+
+def render_cache_key(ctx, font, render_args):
+    """
+    Return the render cache key for a text2image run: a hash of everything
+    which determines its output.
+    """
+    parts = [
+        text2image_version(),
+        file_digest(ctx.training_text),
+        font,
+        font_digest(ctx, font),
+        *render_args,
+    ]
+    if (
+        ctx.extract_font_properties
+        and pathlib.Path(ctx.train_ngrams_file).exists()
+    ):
+        parts.append(file_digest(ctx.train_ngrams_file))
+    return make_key(*parts)
+
+
+def generate_font_image(
+    ctx, font, exposure, char_spacing, cache=None, manifest=None
+):
     """
     Helper function for `phaseI_generate_image`.
 
     Generates the image for a single language/font combination in a way that can be run
-    in parallel.
+    in parallel. If a render cache is given, cached results are reused. If a manifest
+    is given, the rendering is skipped when its outputs are up to date.
     """
-    log.info(f'Rendering using {font}')
     fontname = make_fontname(font)
     outbase = make_outbase(ctx, fontname, exposure)
 
-    common_args = [
-        f'--fontconfig_tmpdir={ctx.font_config_cache}',
-        f'--fonts_dir={ctx.fonts_dir}',
+    # Arguments which affect the rendered output (in contrast to the
+    # locations of files and caches).
+    render_args = [
         f'--strip_unrenderable_words',
         f'--leading={ctx.leading}',
         f'--char_spacing={char_spacing}',
         f'--exposure={exposure}',
-        f'--outputbase={outbase}',
         f'--max_pages={ctx.max_pages}',
     ]
 
     if ctx.distort_image:
-        common_args.append('--distort_image')
+        render_args.append('--distort_image')
 
-    # add --writing_mode=vertical-upright to common_args if the font is
+    # add --writing_mode=vertical-upright to render_args if the font is
     # specified to be rendered vertically.
     vertical_fonts = ctx.vertical_fonts or VERTICAL_FONTS
     if font in vertical_fonts:
-        common_args.append('--writing_mode=vertical-upright')
+        render_args.append('--writing_mode=vertical-upright')
 
+    common_args = [
+        f'--fontconfig_tmpdir={ctx.font_config_cache}',
+        f'--fonts_dir={ctx.fonts_dir}',
+        *render_args,
+        f'--outputbase={outbase}',
+    ]
+
+    extract_font_properties = (
+        ctx.extract_font_properties
+        and pathlib.Path(ctx.train_ngrams_file).exists()
+    )
+    suffixes = ['.tif', '.box']
+    if extract_font_properties:
+        suffixes.append('.fontinfo')
+
+    item = f'{font}-{exposure}'
+    outputs = [f'{outbase}{suffix}' for suffix in suffixes]
+    if cache or manifest:
+        key = render_cache_key(
+            ctx,
+            font,
+            [*render_args, f'--ptsize={ctx.ptsize}', *ctx.text2image_extra_args],
+        )
+    if manifest and manifest.is_current(item, key):
+        log.info(f'Rendering of {font} is up to date')
+        return item
+    if cache and cache.fetch(key, outbase, suffixes):
+        log.info(f'Using cached rendering of {font}')
+        if manifest:
+            manifest.record(item, key, outputs)
+        return item
+
+    # The outputs of an earlier run may be links to render cache entries,
+    # which text2image would overwrite in place.
+    for output in outputs:
+        if os.path.exists(output):
+            os.unlink(output)
+
+    log.info(f'Rendering using {font}')
     run_command(
         'text2image',
         *common_args,
@@ -174,10 +382,7 @@ def generate_font_image(ctx, font, exposure, char_spacing):
 
     check_file_readable(str(outbase) + '.box', str(outbase) + '.tif')
 
-    if (
-        ctx.extract_font_properties
-        and pathlib.Path(ctx.train_ngrams_file).exists()
-    ):
+    if extract_font_properties:
         log.info(f'Extracting font properties of {font}')
         run_command(
             'text2image',
@@ -189,7 +394,28 @@ def generate_font_image(ctx, font, exposure, char_spacing):
             f'--ptsize=32',
         )
         check_file_readable(str(outbase) + '.fontinfo')
-    return f'{font}-{exposure}'
+
+    if cache:
+        cache.store(key, outbase, suffixes)
+    if manifest:
+        manifest.record(item, key, outputs)
+    return item
+
+
+def remove_stale_outputs(ctx):
+    """
+    Remove files of fonts and exposures which are not part of the current run
+    from a reused work directory, so that later phases do not pick them up.
+    """
+    expected = {
+        make_outbase(ctx, make_fontname(font), exposure).name
+        for font in ctx.fonts
+        for exposure in ctx.exposures
+    }
+    for path in pathlib.Path(ctx.training_dir).glob(f'{ctx.lang_code}.*.exp*.*'):
+        if path.name.rsplit('.', 1)[0] not in expected:
+            log.info(f'Removing {path.name} from previous run')
+            path.unlink()
 
 
 def phase_I_generate_image(ctx, par_factor=None):
@@ -203,39 +429,27 @@ def phase_I_generate_image(ctx, par_factor=None):
     check_file_readable(ctx.training_text)
     char_spacing = 0.0
 
-    for exposure in ctx.exposures:
-        if (
-            ctx.extract_font_properties
-            and pathlib.Path(ctx.bigram_freqs_file).exists()
-        ):
-            # Parse .bigram_freqs file and compose a .train_ngrams file with text
-            # for tesseract to recognize during training. Take only the ngrams whose
-            # combined weight accounts for 95% of all the bigrams in the language.
-            lines = (
-                pathlib.Path(ctx.bigram_freqs_file)
-                .read_text(encoding='utf-8')
-                .split('\n')
-            )
-            records = (line.split() for line in lines)
-            p = 0.99
-            ngram_frac = p * sum(
-                int(rec[1]) for rec in records if len(rec) >= 2
-            )
-
-            with pathlib.Path(ctx.train_ngrams_file).open(
-                'w', encoding='utf-8'
-            ) as f:
-                cumsum = 0
-                for bigram, count in sorted(
-                    records, key=itemgetter(1), reverse=True
-                ):
-                    if cumsum > ngram_frac:
-                        break
-                    f.write(bigram + ' ')
-                    cumsum += count
-
-            check_file_readable(ctx.train_ngrams_file)
+    cache = None
+    if ctx.render_cache_size > 0:
+        cache = RenderCache(ctx.cache_dir, ctx.render_cache_size * 1024 * 1024)
+        log.info(f'Using render cache in {cache.root}')
+    manifest = open_manifest(ctx, 'phase_I')
+    if manifest:
+        remove_stale_outputs(ctx)
+
+    if (
+        ctx.extract_font_properties
+        and pathlib.Path(ctx.bigram_freqs_file).exists()
+    ):
+        # Parse .bigram_freqs file and compose a .train_ngrams file with text
+        # for tesseract to recognize during training. Take only the ngrams whose
+        # combined weight accounts for 99% of all the bigrams in the language.
+        make_train_ngrams(
+            ctx.bigram_freqs_file, ctx.train_ngrams_file, ctx.cache_dir
+        )
+        check_file_readable(ctx.train_ngrams_file)
 
+    for exposure in ctx.exposures:
         with tqdm(
             total=len(ctx.fonts)
         ) as pbar, concurrent.futures.ThreadPoolExecutor(
@@ -243,7 +457,13 @@ def phase_I_generate_image(ctx, par_factor=None):
         ) as executor:
             futures = [
                 executor.submit(
-                    generate_font_image, ctx, font, exposure, char_spacing
+                    generate_font_image,
+                    ctx,
+                    font,
+                    exposure,
+                    char_spacing,
+                    cache,
+                    manifest,
                 )
                 for font in ctx.fonts
             ]
@@ -260,9 +480,71 @@ def phase_I_generate_image(ctx, par_factor=None):
             fontname = make_fontname(font)
             outbase = make_outbase(ctx, fontname, exposure)
             check_file_readable(str(outbase) + '.box', str(outbase) + '.tif')
+
+    if cache:
+        cache.evict()
     return
 
 
+# Box files passed to one unicharset_extractor call at most.
+MAX_BOXES_PER_SHARD = 256
+
+_EXPOSURE_SUFFIX = re.compile(r'\.exp-?\d+\.box$')
+
+
+def box_shards(box_files, args):
+    """
+    Split box files into shards for unicharset extraction: the boxes of one
+    font (all its exposures) form a shard, so that adding a font adds a shard
+    and leaves the others unchanged. Shards are limited to what fits on the
+    command line after args.
+    """
+    fonts = {}
+    for box_file in box_files:
+        name = _EXPOSURE_SUFFIX.sub('', box_file.name)
+        fonts.setdefault(name, []).append(box_file)
+    return [
+        chunk
+        for _, boxes in sorted(fonts.items())
+        for i in range(0, len(boxes), MAX_BOXES_PER_SHARD)
+        for chunk in split_args(args, boxes[i : i + MAX_BOXES_PER_SHARD])
+    ]
+
+
+def extract_partial_unicharset(ctx, box_files, cache_root):
+    """
+    Helper function for `phase_UP_generate_unicharset`.
+
+    Extracts the unicharset of a shard of box files into cache_root, named
+    after a digest of the boxes, and returns its path. Unchanged shards are
+    taken from earlier runs.
+    """
+    key = make_key(
+        ctx.norm_mode, *(f'{f.name}:{file_digest(f)}' for f in box_files)
+    )
+    partial = cache_root / f'{key}.unicharset'
+    if partial.exists():
+        # The modification time records the last use for evict_lru().
+        os.utime(partial)
+        return partial
+    tmp = cache_root / f'.tmp-{key}-{os.getpid()}-{threading.get_ident()}'
+    try:
+        run_command(
+            'unicharset_extractor',
+            '--output_unicharset',
+            f'{tmp}',
+            '--norm_mode',
+            f'{ctx.norm_mode}',
+            *box_files,
+        )
+        check_file_readable(tmp)
+        tmp.replace(partial)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return partial
+
+
 def phase_UP_generate_unicharset(ctx):
     """
     Phase UP: Generate (U)nicharset and (P)roperties file.
@@ -271,25 +553,73 @@ def phase_UP_generate_unicharset(ctx):
         '=== Phase UP: Generating unicharset and unichar properties files ==='
     )
 
-    box_files = pathlib.Path(ctx.training_dir).glob('*.box')
+    box_files = sorted(pathlib.Path(ctx.training_dir).glob('*.box'))
 
     ctx.unicharset_file = (
         pathlib.Path(ctx.training_dir) / f'{ctx.lang_code}.unicharset'
     )
+    ctx.xheights_file = (
+        pathlib.Path(ctx.training_dir) / f'{ctx.lang_code}.xheights'
+    )
 
-    run_command(
-        'unicharset_extractor',
-        '--output_unicharset',
-        f'{ctx.unicharset_file}',
-        '--norm_mode',
-        f'{ctx.norm_mode}',
-        *box_files,
+    manifest = open_manifest(ctx, 'phase_UP')
+    if manifest:
+        digest = make_key(
+            ctx.norm_mode,
+            ctx.langdata_dir,
+            *(f'{f.name}:{file_digest(f)}' for f in box_files),
+        )
+        if manifest.is_current('unicharset', digest):
+            log.info('Unicharset is up to date')
+            return
+
+    # Extract a partial unicharset per shard of box files in parallel and
+    # merge them. This also keeps the command lines short with many fonts.
+    if not box_files:
+        err_exit(f'No box files in {ctx.training_dir}')
+    cache_root = pathlib.Path(ctx.cache_dir) / 'unicharset'
+    # The temporary output names of extract_partial_unicharset are about as long.
+    shards = box_shards(
+        box_files,
+        [
+            'unicharset_extractor',
+            '--output_unicharset',
+            cache_root / f'.tmp-{"0" * 64}-{os.getpid()}-{threading.get_ident()}',
+            '--norm_mode',
+            f'{ctx.norm_mode}',
+        ],
     )
+    cache_root.mkdir(parents=True, exist_ok=True)
+    log.info(f'Extracting unicharsets of {len(shards)} box file shards')
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=ctx.jobs
+    ) as executor:
+        futures = [
+            executor.submit(extract_partial_unicharset, ctx, shard, cache_root)
+            for shard in shards
+        ]
+        partials = []
+        for future in futures:
+            try:
+                partials.append(future.result())
+            except Exception as exc:
+                err_exit('Failed while extracting unicharsets: ' + str(exc))
+
+    if len(partials) == 1:
+        shutil.copyfile(partials[0], ctx.unicharset_file)
+    else:
+        # Merge as many partials as fit on the command line at once, each
+        # chunk into the result of the previous ones.
+        merged = []
+        for chunk in split_args(
+            ['merge_unicharsets', ctx.unicharset_file, ctx.unicharset_file],
+            partials,
+        ):
+            run_command('merge_unicharsets', *merged, *chunk, ctx.unicharset_file)
+            merged = [ctx.unicharset_file]
     check_file_readable(ctx.unicharset_file)
+    evict_lru(cache_root, DERIVED_CACHE_SIZE)
 
-    ctx.xheights_file = (
-        pathlib.Path(ctx.training_dir) / f'{ctx.lang_code}.xheights'
-    )
     run_command(
         'set_unicharset_properties',
         '-U',
@@ -301,6 +631,46 @@ def phase_UP_generate_unicharset(ctx):
         f'--script_dir={ctx.langdata_dir}',
     )
     check_file_readable(ctx.xheights_file)
+    if manifest:
+        manifest.record(
+            'unicharset', digest, [ctx.unicharset_file, ctx.xheights_file]
+        )
+
+
+def extract_image_features(
+    img_file, box_config, config, env, ext, manifest=None
+):
+    """
+    Helper function for `phase_E_extract_features`.
+
+    Runs tesseract on a single image and returns the elapsed time in seconds. If a
+    manifest is given, tesseract is not run when the output is up to date, and None
+    is returned.
+    """
+    start = time.perf_counter()
+    if manifest:
+        digest = make_key(
+            file_digest(img_file),
+            file_digest(pathlib.Path(img_file).with_suffix('.box')),
+            file_digest(config) if config else '',
+            env['TESSDATA_PREFIX'],
+            *box_config,
+        )
+        if manifest.is_current(img_file.name, digest):
+            return None
+    run_command(
+        'tesseract',
+        img_file,
+        pathlib.Path(img_file).with_suffix(''),
+        *box_config,
+        config,
+        env=env,
+    )
+    if manifest:
+        manifest.record(
+            img_file.name, digest, [pathlib.Path(img_file).with_suffix('.' + ext)]
+        )
+    return time.perf_counter() - start
 
 
 def phase_E_extract_features(ctx, box_config, ext):
@@ -309,7 +679,13 @@ def phase_E_extract_features(ctx, box_config, ext):
     """
     log.info(f'=== Phase E: Generating {ext} files ===')
 
-    img_files = list(pathlib.Path(ctx.training_dir).glob('*.exp*.tif'))
+    # Schedule the largest images first (longest processing time first), so
+    # that no single big image is left running alone at the end.
+    img_files = sorted(
+        pathlib.Path(ctx.training_dir).glob('*.exp*.tif'),
+        key=lambda img_file: img_file.stat().st_size,
+        reverse=True,
+    )
     log.debug(img_files)
 
     # Use any available language-specific configs.
@@ -325,38 +701,64 @@ def phase_E_extract_features(ctx, box_config, ext):
 
     tessdata_environ = os.environ.copy()
     tessdata_environ['TESSDATA_PREFIX'] = str(ctx.tessdata_dir)
+    # Parallelism comes from the worker pool, so each tesseract process
+    # should use a single thread.
+    tessdata_environ['OMP_THREAD_LIMIT'] = '1'
 
     log.info(f"Using TESSDATA_PREFIX={tessdata_environ['TESSDATA_PREFIX']}")
+    log.info(f'Running {ctx.jobs} tesseract processes in parallel')
 
+    manifest = open_manifest(ctx, f'phase_E_{ext}')
+    timings = {}
+    up_to_date = 0
+    start = time.perf_counter()
     with tqdm(
         total=len(img_files)
     ) as pbar, concurrent.futures.ThreadPoolExecutor(
-        max_workers=2
+        max_workers=ctx.jobs
     ) as executor:
-        futures = []
-        for img_file in img_files:
-            future = executor.submit(
-                run_command,
-                'tesseract',
+        futures = {
+            executor.submit(
+                extract_image_features,
                 img_file,
-                pathlib.Path(img_file).with_suffix(''),
-                *box_config,
+                box_config,
                 config,
-                env=tessdata_environ,
-            )
-            futures.append(future)
+                tessdata_environ,
+                ext,
+                manifest,
+            ): img_file
+            for img_file in img_files
+        }
 
         for future in concurrent.futures.as_completed(futures):
             try:
-                future.result()
+                seconds = future.result()
             except Exception as exc:
                 err_exit('Failed while extracting features: ' + str(exc))
             else:
+                if seconds is None:
+                    up_to_date += 1
+                else:
+                    timings[futures[future]] = seconds
                 pbar.update(1)
     # Check that all the output files were produced.
     for img_file in img_files:
         check_file_readable(pathlib.Path(img_file.with_suffix('.' + ext)))
 
+    if up_to_date:
+        log.info(f'{up_to_date} {ext} files were up to date')
+
+    if timings:
+        log.info(
+            f'Extracted features of {len(timings)} images in '
+            f'{time.perf_counter() - start:.1f}s '
+            f'({sum(timings.values()):.1f}s total processing time)'
+        )
+        for img_file, seconds in sorted(
+            timings.items(), key=itemgetter(1), reverse=True
+        ):
+            log.debug(f'{seconds:8.1f}s {img_file.name}')
+
     return
 
 
@@ -404,8 +806,13 @@ def make_lstmdata(ctx):
         yield from training_path.glob(f'{ctx.lang_code}.*.lstmf')
 
     for f in get_file_list():
-        log.debug(f'Moving {f} to {path_output / f.name}')
-        shutil.move(str(f), path_output / f.name)
+        if ctx.work_dir:
+            # Keep the files in the work directory for later runs.
+            log.debug(f'Copying {f} to {path_output / f.name}')
+            shutil.copy2(str(f), path_output / f.name)
+        else:
+            log.debug(f'Moving {f} to {path_output / f.name}')
+            shutil.move(str(f), path_output / f.name)
 
     lstm_list = f'{ctx.output_dir}/{ctx.lang_code}.training_files.txt'
     dir_listing = (
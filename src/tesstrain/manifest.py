@@ -0,0 +1,90 @@
+# (C) Copyright 2014, Google Inc.
+# (C) Copyright 2018, James R Barlow
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per-phase stamp files for resumable runs in a persistent work directory.
+"""
+
+import json
+import logging
+import pathlib
+import threading
+
+log = logging.getLogger(__name__)
+
+STAMP_DIR = '.stamps'
+
+
+class PhaseManifest:
+    """
+    Record of the work items completed by one phase.
+
+    Each item is stored with a digest of its inputs and the names of its
+    output files (relative to the training directory). The records are
+    appended to `<training_dir>/.stamps/<phase>.jsonl` as soon as an item is
+    done, so a crash only loses the items which were still running.
+    """
+
+    def __init__(self, training_dir, phase):
+        self.training_dir = pathlib.Path(training_dir)
+        self.path = self.training_dir / STAMP_DIR / f'{phase}.jsonl'
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.records = {}
+        if self.path.exists():
+            with self.path.open(encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Incomplete last line after a crash.
+                        continue
+                    self.records[record['item']] = record
+
+    def is_current(self, item, digest):
+        """
+        Return True if item was completed with the same input digest and all
+        its outputs still exist.
+        """
+        record = self.records.get(item)
+        return bool(
+            record
+            and record['digest'] == digest
+            and all(
+                (self.training_dir / output).exists()
+                for output in record['outputs']
+            )
+        )
+
+    def record(self, item, digest, outputs):
+        record = {
+            'item': item,
+            'digest': digest,
+            'outputs': [
+                str(pathlib.Path(output).relative_to(self.training_dir))
+                for output in outputs
+            ],
+        }
+        with self._lock:
+            self.records[item] = record
+            with self.path.open('a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def open_manifest(ctx, phase):
+    """
+    Return the manifest for phase, or None if the run does not use a
+    persistent work directory.
+    """
+    if not ctx.work_dir:
+        return None
+    return PhaseManifest(ctx.training_dir, phase)
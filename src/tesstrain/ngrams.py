@@ -0,0 +1,125 @@
+# (C) Copyright 2014, Google Inc.
+# (C) Copyright 2018, James R Barlow
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+N-gram frequency files and the .train_ngrams text for font property extraction.
+"""
+
+import array
+import heapq
+import logging
+import os
+import pathlib
+
+from tesstrain.cache import (
+    DERIVED_CACHE_SIZE,
+    evict_lru,
+    file_digest,
+    link_or_copy,
+    make_key,
+)
+
+log = logging.getLogger(__name__)
+
+# Fraction of all bigram occurrences covered by the selected ngrams.
+NGRAM_FRACTION = 0.99
+
+
+def read_ngram_freqs(filename):
+    """
+    Parse a frequency file with lines of `ngram count`.
+
+    Returns the list of ngrams and an array of their counts, in file order.
+    Lines without a numeric count are skipped.
+    """
+    ngrams = []
+    counts = array.array('q')
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            try:
+                count = int(fields[1])
+            except ValueError:
+                continue
+            ngrams.append(fields[0])
+            counts.append(count)
+    return ngrams, counts
+
+
+def select_top_mass(counts, fraction=NGRAM_FRACTION):
+    """
+    Return the indices of the most frequent ngrams, in descending order of
+    their counts, until their combined count exceeds fraction of the total.
+
+    Only the selected entries are popped from a heap, so the cost is linear
+    in the number of ngrams plus logarithmic per selected ngram, instead of
+    a full sort. Ties are broken by file order.
+    """
+    limit = fraction * sum(counts)
+    heap = [(-count, i) for i, count in enumerate(counts)]
+    heapq.heapify(heap)
+    selected = []
+    cumsum = 0
+    while heap and cumsum <= limit:
+        count, i = heapq.heappop(heap)
+        selected.append(i)
+        cumsum -= count
+    return selected
+
+
+def make_train_ngrams(
+    bigram_freqs_file,
+    train_ngrams_file,
+    cache_dir=None,
+    fraction=NGRAM_FRACTION,
+):
+    """
+    Write the ngrams accounting for fraction of all bigrams in the language to
+    train_ngrams_file, separated by spaces.
+
+    If cache_dir is given, the result is cached there, keyed on the digest of
+    the frequency file, and reused by later runs.
+    """
+    cached = None
+    if cache_dir:
+        key = make_key(
+            'train_ngrams', file_digest(bigram_freqs_file), fraction
+        )
+        cached = pathlib.Path(cache_dir) / 'ngrams' / key
+        if cached.exists():
+            log.info(f'Using cached {pathlib.Path(train_ngrams_file).name}')
+            link_or_copy(cached, train_ngrams_file)
+            # The modification time records the last use for evict_lru().
+            os.utime(cached)
+            return
+
+    ngrams, counts = read_ngram_freqs(bigram_freqs_file)
+    selected = select_top_mass(counts, fraction)
+    log.info(f'Selected {len(selected)} of {len(ngrams)} ngrams')
+    # Replaced instead of overwritten, it may be a link to a cache entry.
+    tmp = f'{train_ngrams_file}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for i in selected:
+            f.write(ngrams[i] + ' ')
+    os.replace(tmp, train_ngrams_file)
+
+    if cached:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_name(f'.tmp-{cached.name}-{os.getpid()}')
+        try:
+            link_or_copy(train_ngrams_file, tmp)
+            tmp.replace(cached)
+        except OSError as e:
+            log.warning(f'Could not cache {train_ngrams_file}: {e}')
+        evict_lru(cached.parent, DERIVED_CACHE_SIZE)
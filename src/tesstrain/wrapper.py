@@ -70,6 +70,10 @@ def run(
     tessdata_directory: Optional[str] = None,
     exposures: Optional[List[int]] = None,
     point_size: int = 12,
+    jobs: Optional[int] = None,
+    cache_directory: Optional[str] = None,
+    render_cache_size: int = 10240,
+    work_directory: Optional[str] = None,
 ):
     """
     :param fonts: A list of font names to train on. These need to be recognizable by
@@ -103,6 +107,15 @@ def run(
     :param exposures: A list of exposure levels to use (e.g. `[-1, 0, 1]`). If
                       unspecified, language-specific ones will be used.
     :param point_size: Size of printed text.
+    :param jobs: Number of parallel tesseract processes for feature extraction. If
+                 unspecified, the number of CPUs will be used.
+    :param cache_directory: Path to the persistent cache shared between runs. If
+                            unspecified, `$XDG_CACHE_HOME/tesstrain` will be used.
+    :param render_cache_size: Maximum size of the cache for rendered images in
+                              megabytes. Set to 0 to disable the cache.
+    :param work_directory: Path to a persistent training directory which is kept after
+                           the run. Rerunning with the same directory skips all work
+                           whose inputs are unchanged (e.g. after a crash).
     """
     ctx = TrainingArguments()
     ctx.fonts = fonts
@@ -122,6 +135,10 @@ def run(
     ctx.tessdata_dir = tessdata_directory
     ctx.exposures = exposures
     ctx.ptsize = point_size
+    ctx.jobs = jobs
+    ctx.cache_dir = cache_directory
+    ctx.render_cache_size = render_cache_size
+    ctx.work_dir = work_directory
 
     verify_parameters_and_handle_defaults(ctx)
 
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Single pass parser for lstmtraining logs.
+
+Extracts the four series used by the plot scripts in one read of the log:
+
+  iteration   BCER train reported every 100 iterations
+  checkpoint  CER of the best models written as checkpoints
+  eval        BCER eval of the periodic evaluations during training
+  sub         BCER train of the subtrainer
+
+Parsing is incremental: LogReader remembers the byte offset after the last
+complete line, so a log which is still growing only has to be read from
+there. Used as a script it updates the four TSV files of the Makefile plot
+targets, appending the new rows if the state file written by the previous
+run still matches the log.
+"""
+
+import argparse
+import array
+import json
+import os
+import re
+import sys
+
+SERIES = ('iteration', 'checkpoint', 'eval', 'sub')
+
+# Columns of the TSV files read by plot_cer.py and plot_log.py.
+COLUMNS = (
+    'Name',
+    'CheckpointCER',
+    'LearningIteration',
+    'TrainingIteration',
+    'EvalCER',
+    'IterationCER',
+    'SubtrainerCER',
+)
+
+# Columns which are filled for each series, with their array type codes
+# ('u' marks a list of strings).
+SERIES_COLUMNS = {
+    'iteration': {'LearningIteration': 'q', 'TrainingIteration': 'q', 'IterationCER': 'd'},
+    'checkpoint': {
+        'Name': 'u',
+        'CheckpointCER': 'd',
+        'LearningIteration': 'q',
+        'TrainingIteration': 'q',
+    },
+    'eval': {'LearningIteration': 'q', 'EvalCER': 'd'},
+    'sub': {'LearningIteration': 'q', 'TrainingIteration': 'q', 'SubtrainerCER': 'd'},
+}
+
+TRAIN_RE = re.compile(r'At iteration (\d+)/(\d+)/\d+.*?BCER train=([0-9.]+)%')
+BEST_MODEL_RE = re.compile(r'best model:(\S*?)([^/\s]+)\.checkpoint')
+EVAL_RE = re.compile(r'At iteration (\d+), stage \d+, BCER eval=([0-9.]+)')
+
+# Lines starting with these do not report the training error of the main
+# trainer (same filter as the former grep/sed chain of the Makefile).
+NOT_ITERATION = ('Sub', 'Update', ' New worst BCER')
+
+
+def parse_line(line):
+    """Return a list of (series, row) tuples for one line of the log."""
+    found = []
+    if 'At iteration' in line:
+        m = TRAIN_RE.search(line)
+        if m:
+            row = {
+                'LearningIteration': int(m.group(1)),
+                'TrainingIteration': int(m.group(2)),
+            }
+            if line.startswith('UpdateSubtrainer'):
+                found.append(('sub', dict(row, SubtrainerCER=float(m.group(3)))))
+            elif not line.startswith(NOT_ITERATION):
+                found.append(('iteration', dict(row, IterationCER=float(m.group(3)))))
+        m = EVAL_RE.search(line)
+        if m:
+            found.append(
+                ('eval', {'LearningIteration': int(m.group(1)), 'EvalCER': float(m.group(2))})
+            )
+    if 'best model' in line:
+        m = BEST_MODEL_RE.search(line)
+        if m:
+            # MODEL_CER_LEARNINGITERATION_TRAININGITERATION
+            fields = m.group(2).rsplit('_', 3)
+            if len(fields) == 4:
+                name, cer, learning, training = fields
+                found.append(
+                    (
+                        'checkpoint',
+                        {
+                            'Name': name,
+                            'CheckpointCER': float(cer),
+                            'LearningIteration': int(learning),
+                            'TrainingIteration': int(training),
+                        },
+                    )
+                )
+    return found
+
+
+class LogReader:
+    """
+    Incremental reader for a (growing) lstmtraining log.
+
+    Only complete lines are consumed, a line which is still being written is
+    read again by the next call of read(). If the log was replaced or
+    truncated, reading starts again from the beginning and `restarted` is set.
+    """
+
+    def __init__(self, filename, offset=0, inode=None):
+        self.filename = filename
+        self.offset = offset
+        self.inode = inode
+        self.restarted = False
+
+    @classmethod
+    def from_state(cls, filename, state):
+        return cls(filename, state.get('offset', 0), state.get('inode'))
+
+    def state(self):
+        return {'offset': self.offset, 'inode': self.inode}
+
+    def read(self):
+        """
+        Return the (series, row) tuples of all new complete lines, or none if
+        the log does not exist (yet, or while it is rotated).
+        """
+        self.restarted = False
+        try:
+            f = open(self.filename, 'rb')
+        except FileNotFoundError:
+            return []
+
+        found = []
+        with f:
+            st = os.fstat(f.fileno())
+            if (self.inode is not None and st.st_ino != self.inode) or st.st_size < self.offset:
+                self.offset = 0
+                self.restarted = True
+            self.inode = st.st_ino
+
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                self.offset += len(line)
+                found.extend(parse_line(line.decode('utf-8', errors='replace')))
+        return found
+
+
+class TrainingLog:
+    """The four series of a training log as columnar arrays."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.series = {
+            name: {
+                column: [] if code == 'u' else array.array(code)
+                for column, code in columns.items()
+            }
+            for name, columns in SERIES_COLUMNS.items()
+        }
+
+    def add(self, series, row):
+        for column, values in self.series[series].items():
+            values.append(row[column])
+
+    def extend(self, found):
+        for series, row in found:
+            self.add(series, row)
+
+    def __len__(self):
+        return sum(len(columns['LearningIteration']) for columns in self.series.values())
+
+
+def read_log(filename):
+    """Parse a complete training log into a TrainingLog."""
+    log = TrainingLog()
+    log.extend(LogReader(filename).read())
+    return log
+
+
+def format_row(row):
+    return '\t'.join('' if row.get(column) is None else str(row[column]) for column in COLUMNS)
+
+
+def update_tsvs(logfile, tsv_files, state_file=None):
+    """
+    Write the rows of the four series to tsv_files (a dictionary from series
+    name to file name).
+
+    With a state file, only the part of the log added since the last call is
+    parsed and its rows are appended, unless the log or one of the TSV files
+    was replaced in the meantime.
+    """
+    state = {}
+    if state_file and os.path.exists(state_file):
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    if state.get('log') != os.path.abspath(logfile) or not all(
+        os.path.exists(tsv_files[series]) for series in SERIES
+    ):
+        state = {}
+
+    reader = LogReader.from_state(logfile, state)
+    found = reader.read()
+    append = bool(state) and not reader.restarted
+
+    outputs = {
+        series: open(tsv_files[series], 'a' if append else 'w', encoding='utf-8', newline='\n')
+        for series in SERIES
+    }
+    try:
+        if not append:
+            for f in outputs.values():
+                f.write('\t'.join(COLUMNS) + '\n')
+        for series, row in found:
+            outputs[series].write(format_row(row) + '\n')
+    finally:
+        for f in outputs.values():
+            f.close()
+
+    if state_file:
+        with open(state_file, 'w', encoding='utf-8') as f:
+            json.dump(dict(reader.state(), log=os.path.abspath(logfile)), f)
+    return len(found)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='Extract the iteration, checkpoint, eval and subtrainer CER series '
+        'from an lstmtraining log into TSV files'
+    )
+    arg_parser.add_argument('log', help='lstmtraining log file')
+    arg_parser.add_argument('iteration_tsv', help='TSV file for the BCER every 100 iterations')
+    arg_parser.add_argument('checkpoint_tsv', help='TSV file for the checkpoint CER')
+    arg_parser.add_argument('eval_tsv', help='TSV file for the eval CER')
+    arg_parser.add_argument('sub_tsv', help='TSV file for the subtrainer CER')
+    arg_parser.add_argument(
+        '--state', metavar='FILE', help='State file for incremental updates of the TSV files'
+    )
+    args = arg_parser.parse_args()
+
+    tsv_files = dict(
+        zip(SERIES, (args.iteration_tsv, args.checkpoint_tsv, args.eval_tsv, args.sub_tsv))
+    )
+    count = update_tsvs(args.log, tsv_files, args.state)
+    print('%d new rows from %s' % (count, args.log), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()